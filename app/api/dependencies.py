@@ -1,16 +1,18 @@
-from typing import AsyncGenerator
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional
+import threading
+import httpx
+from fastapi import Header
 from app.services.scraper import ScraperService
-from app.services.chat import ChatService
-from app.core.config import settings, Settings
-from app.services.llm import LLMService
+from app.services.chat import ChatService, DOCUMENTS_SENTINEL, prime_system_prompt
+from app.core.config import get_settings
+from app.services.llm import LLMService, llm_service
 
-NBA_SYSTEM_PROMPT = """You are an AI assistant specialized in sports betting analysis, working alongside a user who has practical experience but lacks formal academic training in statistics, data analysis, and game theory. Your role is to complement the user's knowledge, push them to do better, providing insights and analysis based on the given data. You will be analyzing various types of sports-related information, including game statistics, forecasts, injury reports, and news articles for sports like NBA, NFL, and soccer.
+settings = get_settings()
 
-Here is the scraped webpage data, converted and cleaned into markdown format:
-<scraped_data>
-    <documents>
-    </documents>
-</scraped_data>
+# Static instructions are kept ahead of the documents block so the prompt prefix is
+# byte-identical across requests and can be served from the provider's prompt cache.
+NBA_SYSTEM_PROMPT_STATIC = """You are an AI assistant specialized in sports betting analysis, working alongside a user who has practical experience but lacks formal academic training in statistics, data analysis, and game theory. Your role is to complement the user's knowledge, push them to do better, providing insights and analysis based on the given data. You will be analyzing various types of sports-related information, including game statistics, forecasts, injury reports, and news articles for sports like NBA, NFL, and soccer.
 
 Guidelines for analysis and response:
 1. Always ground your analysis in the provided data. Do not make assumptions or introduce information that isn't present in the scraped data.
@@ -20,6 +22,7 @@ Guidelines for analysis and response:
 5. If you reference injury reports or news, discuss how these factors might affect game outcomes or betting lines.
 6. Be prepared to explain complex concepts related to statistics, probability, or game theory if they're relevant to the analysis.
 7. Avoid making definitive predictions. Instead, discuss probabilities and potential scenarios.
+8. Some documents are archived to save space and only include a <summary>. If you need the full text of an archived document to answer, reply with only <recall url="SOURCE"/>, using that document's <source>, and it will be provided.
 
 This is an ongoing conversation, so:
 1. Keep track of previously discussed topics and use relevant information to enhance your current responses.
@@ -30,29 +33,78 @@ When responding to the user's query, structure your response as follows:
 1. Begin with a brief summary of the relevant data from the scraped information.
 2. Provide your analysis and insights, clearly explaining your reasoning.
 3. If applicable, mention any limitations in the data or analysis.
-4. Conclude with actionable insights or suggestions for further investigation."""
+4. Conclude with actionable insights or suggestions for further investigation.
+
+Here is the scraped webpage data, converted and cleaned into markdown format:
+"""
+
+# Dynamic part of the prompt, rewritten by ChatService as URLs are added/removed
+NBA_DOCUMENTS_BLOCK = f"""<scraped_data>
+{DOCUMENTS_SENTINEL}
+</scraped_data>"""
+
+NBA_SYSTEM_PROMPT = NBA_SYSTEM_PROMPT_STATIC + NBA_DOCUMENTS_BLOCK
 
-# Create a single instance of ChatService
-_chat_service = ChatService(
-    model=settings.DEFAULT_MODEL,
-    tok_model="gpt2",  # Using gpt2 tokenizer as it's widely compatible
-    system=NBA_SYSTEM_PROMPT
+# Tokenize the template once at import rather than in every new conversation
+prime_system_prompt(settings.DEFAULT_MODEL, NBA_SYSTEM_PROMPT)
+
+# Shared connection pool for outbound scraping requests, closed on app shutdown.
+# Every scrape goes to the same ScraperAPI host, so keep idle connections around and
+# retry connection failures on the transport instead of failing the scrape.
+scraper_http_client = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=60)
+    ),
+    headers={"User-Agent": f"{settings.PROJECT_NAME} scraper"},
+    timeout=settings.SCRAPER_TIMEOUT
 )
 
+# Chat state is kept per conversation so concurrent conversations never share history.
+# Conversation ids come from clients, so the registry is an LRU capped at MAX_CHAT_SESSIONS.
+DEFAULT_CONVERSATION_ID = "default"
+_chat_services: "OrderedDict[str, ChatService]" = OrderedDict()
+_chat_services_lock = threading.Lock()
+
+def get_conversation_chat_service(conversation_id: Optional[str]) -> ChatService:
+    """Return the chat service for a conversation, creating it on first use"""
+    conversation_id = conversation_id or DEFAULT_CONVERSATION_ID
+    evicted = []
+    with _chat_services_lock:
+        service = _chat_services.get(conversation_id)
+        if service is None:
+            service = ChatService(
+                model=settings.DEFAULT_MODEL,
+                system=NBA_SYSTEM_PROMPT,
+                conversation_id=conversation_id
+            )
+            _chat_services[conversation_id] = service
+            while len(_chat_services) > settings.MAX_CHAT_SESSIONS:
+                evicted.append(_chat_services.popitem(last=False)[1])
+        else:
+            _chat_services.move_to_end(conversation_id)
+    # Outside the registry lock; a request still holding an evicted service just sees it emptied
+    for stale in evicted:
+        stale.clear_context()
+    return service
+
+# Shared so in-flight scrapes and the fetch cache are visible across requests
+_scraper_service = ScraperService(settings, scraper_http_client)
+
 async def get_scraper_service() -> AsyncGenerator[ScraperService, None]:
     """
     Dependency provider for ScraperService.
     """
-    settings = Settings()
-    service = ScraperService(settings)
     try:
-        yield service
+        yield _scraper_service
     finally:
         pass  # No cleanup needed for now
 
-async def get_chat_service() -> ChatService:
-    """Return the singleton chat service instance"""
-    return _chat_service
+def get_chat_service(x_conversation_id: Optional[str] = Header(None)) -> ChatService:
+    """Return the chat service for the conversation named in the X-Conversation-ID header"""
+    return get_conversation_chat_service(x_conversation_id)
 
-def get_llm_service():
-    return LLMService()
\ No newline at end of file
+def get_llm_service() -> LLMService:
+    """Return the shared LLM service so every request reuses its connection pool"""
+    return llm_service
\ No newline at end of file
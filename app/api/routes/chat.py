@@ -1,68 +1,80 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi import APIRouter, HTTPException, Depends, Body, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from uuid import UUID
 import logging
+from app.core.config import get_settings
 from app.services.chat import ChatService
 from app.services.scraper import ScraperService
 from app.services.llm import LLMService
-from app.api.dependencies import get_chat_service, get_scraper_service, get_llm_service
-from app.models.chat import ChatRequest, ChatResponse
+from app.api.dependencies import (
+    get_chat_service,
+    get_conversation_chat_service,
+    get_scraper_service,
+    get_llm_service
+)
+from app.models.chat import ChatRequest, ChatResponse, ClearContextRequest, ContextBatchRequest
 from app.models.scraper import URLEntry
 import asyncio
+import json
 from functools import partial
 
+settings = get_settings()
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.post("/message")
 async def send_message(
-    request: dict = Body(...),
-    chat_service: ChatService = Depends(get_chat_service)
+    request: ChatRequest,
+    x_conversation_id: Optional[str] = Header(None)
 ):
     """
-    Send a message to the chat bot and get a response.
+    Send a message to the chat bot and stream the response as server-sent events.
+    
+    Each event is a JSON object: {"type": "delta", "content": ...} as text arrives,
+    then {"type": "done"}, or {"type": "error", "detail": ...} if generation fails.
     """
-    try:
-        message = request.get('message')
-        logger.info(f"Received chat message request")
+    message = request.message
+    # Resolved once, body id first: resolving the header too would create or touch a second
+    # (often "default") session and could push a live one out of the MAX_CHAT_SESSIONS LRU
+    chat_service = get_conversation_chat_service(request.conversation_id or x_conversation_id)
+    logger.info(f"Received chat message request")
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug(f"Message content: {message}")
-        
-        # Run the synchronous process_message in a thread pool
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(
-            None,
-            partial(chat_service.process_message, message)
-        )
-        logger.info("Successfully processed message")
-        logger.debug(f"Response content: {response}")
-        
-        return {
-            "message": {
-                "role": "assistant",
-                "content": response,
-                "timestamp": None
-            }
-        }
-    except Exception as e:
-        logger.error(f"Error processing message: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def _stream():
+        try:
+            async for chunk in chat_service.astream_message(message):
+                yield f"data: {json.dumps({'type': 'delta', 'content': chunk})}\n\n"
+            logger.info("Successfully processed message")
+            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            logger.error(f"Error processing message: {str(e)}", exc_info=True)
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/context/clear")
 async def clear_context(
-    request: dict = Body(...),
-    chat_service: ChatService = Depends(get_chat_service)
+    request: ClearContextRequest,
+    x_conversation_id: Optional[str] = Header(None)
 ):
     """
     Clear the chat context for a conversation.
     """
     try:
+        # Resolved once, body id first, like send_message
+        chat_service = get_conversation_chat_service(request.conversation_id or x_conversation_id)
         logger.info("Clearing chat context")
         
-        # Run the synchronous clear_context in a thread pool
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None,
-            chat_service.clear_context
-        )
+        # Dropping documents is cheap in-memory work, so skip the executor hop
+        chat_service.clear_context()
         
         logger.info("Successfully cleared chat context")
         return {"status": "success"}
@@ -70,6 +82,87 @@ async def clear_context(
         logger.error(f"Error clearing context: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _add_url_to_context(
+    url_id: UUID,
+    chat_service: ChatService,
+    scraper_service: ScraperService
+) -> None:
+    """Load a scraped URL and add its content to the chat context"""
+    # Get the URL entry from the in-memory index; the body is read below
+    loop = asyncio.get_running_loop()
+    url_entry = scraper_service.get_url_entry(url_id)
+    
+    if not url_entry:
+        logger.warning(f"URL content not found for ID: {url_id}")
+        raise HTTPException(status_code=404, detail="URL content not found")
+    
+    if url_entry.status != 'complete':
+        logger.warning(f"URL content not ready. Status: {url_entry.status}")
+        raise HTTPException(status_code=400, detail=f"URL content not ready. Status: {url_entry.status}")
+    
+    token_count = url_entry.token_count
+    # Oversized documents are read back from the content store capped to the main context budget
+    oversized = (token_count or 0) > settings.MAIN_CONTEXT_BUDGET
+    content = await loop.run_in_executor(
+        None,
+        partial(
+            scraper_service.read_content,
+            url_entry.id,
+            settings.MAIN_CONTEXT_BUDGET * settings.BYTES_PER_TOKEN if oversized else None
+        )
+    )
+    
+    if not content:
+        logger.warning(f"URL has no content")
+        raise HTTPException(status_code=400, detail="URL has no content")
+    
+    logger.debug(f"Retrieved content for URL: {url_entry.url}")
+    if oversized:
+        logger.info(f"Truncating {token_count}-token document to the main context budget")
+        token_count = None
+    
+    # Update the chat context with the URL content
+    await loop.run_in_executor(
+        None,
+        partial(chat_service.update_context, url_entry.url, content, token_count)
+    )
+
+@router.post("/context/batch")
+async def update_context_batch(
+    request: ContextBatchRequest,
+    chat_service: ChatService = Depends(get_chat_service),
+    scraper_service: ScraperService = Depends(get_scraper_service)
+):
+    """
+    Update the chat context with content from several scraped URLs concurrently.
+    """
+    ids = request.ids
+    logger.info(f"Updating context from {len(ids)} URL IDs (max_concurrency={request.max_concurrency})")
+    sem = asyncio.Semaphore(request.max_concurrency)
+    
+    async def _one(url_id: UUID) -> None:
+        async with sem:
+            await _add_url_to_context(url_id, chat_service, scraper_service)
+    
+    results = await asyncio.gather(*map(_one, ids), return_exceptions=True)
+    
+    statuses = []
+    for url_id, result in zip(ids, results):
+        if isinstance(result, HTTPException):
+            statuses.append({"url_id": str(url_id), "status": "error", "detail": result.detail})
+        elif isinstance(result, Exception):
+            logger.error(f"Error updating context from URL {url_id}: {str(result)}", exc_info=result)
+            statuses.append({"url_id": str(url_id), "status": "error", "detail": str(result)})
+        else:
+            statuses.append({"url_id": str(url_id), "status": "success"})
+    
+    failed = sum(1 for entry in statuses if entry["status"] == "error")
+    logger.info(f"Batch context update finished: {len(ids) - failed} succeeded, {failed} failed")
+    return {
+        "status": "success" if not failed else "partial",
+        "results": statuses
+    }
+
 @router.post("/context/{url_id}")
 async def update_context(
     url_id: UUID,
@@ -81,38 +174,12 @@ async def update_context(
     """
     try:
         logger.info(f"Updating context from URL ID: {url_id}")
-        
-        # Get the URL entry with its content
-        loop = asyncio.get_running_loop()
-        url_entry = await loop.run_in_executor(
-            None,
-            partial(scraper_service.get_url_content, url_id)
-        )
-        
-        if not url_entry:
-            logger.warning(f"URL content not found for ID: {url_id}")
-            raise HTTPException(status_code=404, detail="URL content not found")
-        
-        if url_entry.status != 'complete':
-            logger.warning(f"URL content not ready. Status: {url_entry.status}")
-            raise HTTPException(status_code=400, detail=f"URL content not ready. Status: {url_entry.status}")
-        
-        if not url_entry.content:
-            logger.warning(f"URL has no content")
-            raise HTTPException(status_code=400, detail="URL has no content")
-        
-        logger.debug(f"Retrieved content for URL: {url_entry.url}")
-        
-        # Update the chat context with the URL content
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None,
-            partial(chat_service.update_context, url_entry.url, url_entry.content)
-        )
-        
+        await _add_url_to_context(url_id, chat_service, scraper_service)
         logger.info(f"Successfully updated context with URL content")
         return {"status": "success"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating context from URL: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -127,12 +194,8 @@ async def remove_url_from_context(
     """
     try:
         logger.info(f"Removing content for URL: {url}")
-        # Run the synchronous remove_url_content in a thread pool
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None,
-            partial(chat_service.remove_url_content, url)
-        )
+        # Dropping a document is cheap in-memory work, so skip the executor hop
+        chat_service.remove_url_content(url)
         logger.info("Successfully removed URL content from context")
         
         return {"status": "success"}
@@ -1,23 +1,43 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Union
 from pydantic import UUID4
 from uuid import UUID
-import logging
 import asyncio
-from functools import partial
+import logging
+import hashlib
+import json
 
 logger = logging.getLogger(__name__)
 
 from app.models.scraper import (
+    ScrapeBatchRequest,
+    ScrapeBatchResponse,
     ScrapeRequest,
     ScrapeResponse,
-    URLEntry
+    ENTRY_BODY_EXCLUDE,
+    URLEntry,
+    URLEntryList
 )
 from app.services.scraper import ScraperService
 from app.api.dependencies import get_scraper_service
 
 scraper_router = APIRouter()
 
+# Idle status streams send a comment this often so proxies don't close them
+EVENTS_KEEPALIVE_SECONDS = 15
+
+def _entry_tag(url_entry: URLEntry) -> str:
+    """Cheap fingerprint of an entry from its metadata; content only changes when status or token count does"""
+    return f"{url_entry.id}:{url_entry.status.value}:{url_entry.token_count}"
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Return a 304 response if the client already holds this ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
 @scraper_router.post("/url")
 async def scrape_url(
     request: ScrapeRequest,
@@ -33,25 +53,99 @@ async def scrape_url(
         logger.error(f"Error processing scrape request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@scraper_router.post("/urls", response_model=ScrapeBatchResponse)
+async def scrape_urls(
+    request: ScrapeBatchRequest,
+    scraper_service: ScraperService = Depends(get_scraper_service)
+):
+    """
+    Scrape several URLs concurrently and store their content
+    """
+    try:
+        responses = await scraper_service.scrape_urls(request.requests)
+        return ScrapeBatchResponse(responses=responses)
+    except Exception as e:
+        logger.error(f"Error processing batch scrape request: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@scraper_router.get("/events/{conversation_id}")
+async def conversation_events(
+    conversation_id: str,
+    request: Request,
+    scraper_service: ScraperService = Depends(get_scraper_service)
+):
+    """
+    Stream status changes of a conversation's URLs as Server-Sent Events.
+    
+    Each change is sent as it happens, so clients don't poll the content endpoint
+    while a scrape runs.
+    """
+    queue = scraper_service.subscribe(conversation_id)
+    
+    async def _stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps({'type': 'status', 'entry': event})}\n\n"
+        finally:
+            scraper_service.unsubscribe(conversation_id, queue)
+    
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @scraper_router.get("/content/{url_id}", response_model=URLEntry)
 async def get_url_content(
     url_id: UUID4,
+    request: Request,
+    response: Response,
     scraper_service: ScraperService = Depends(get_scraper_service)
-) -> URLEntry:
+) -> Union[URLEntry, Response]:
     """
     Get the scraped content for a specific URL.
+    
+    Responds 304 Not Modified when If-None-Match matches the entry's ETag, so status
+    polling doesn't re-send the full content. The page bodies are only read from the
+    content store when they are sent.
     """
-    url_entry = scraper_service.get_url_content(url_id)
+    url_entry = scraper_service.get_url_entry(url_id)
     if not url_entry:
         raise HTTPException(status_code=404, detail="URL entry not found")
-    return url_entry
+    
+    etag = f'W/"{_entry_tag(url_entry)}"'
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+    return await scraper_service.get_url_content(url_id)
 
 @scraper_router.get("/conversation/{conversation_id}", response_model=List[URLEntry])
 async def get_conversation_urls(
     conversation_id: str,
+    request: Request,
     scraper_service: ScraperService = Depends(get_scraper_service)
-) -> List[URLEntry]:
+) -> Response:
     """
-    Get all URLs associated with a specific conversation.
+    Get all URLs associated with a specific conversation, as metadata only.
+    
+    Page bodies are served by the content endpoint. Supports If-None-Match like it.
     """
-    return scraper_service.get_conversation_urls(conversation_id)
+    url_entries = scraper_service.get_conversation_urls(conversation_id)
+    
+    digest = hashlib.sha1("|".join(_entry_tag(entry) for entry in url_entries).encode()).hexdigest()
+    etag = f'W/"{digest}"'
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    # Serialize with the precompiled list adapter instead of re-validating through response_model
+    return Response(
+        content=URLEntryList.dump_json(url_entries, exclude=ENTRY_BODY_EXCLUDE),
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
@@ -1,6 +1,7 @@
-from pydantic_settings import BaseSettings
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from functools import lru_cache
 from typing import Optional
-import os
 from pathlib import Path
 from secret_keys import OPENROUTER_API_KEY, SCRAPER_API_KEY
 
@@ -8,6 +9,8 @@ class Settings(BaseSettings):
     # Base
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "NBA Chat Assistant"
+    ENV: str = "dev"  # "dev" enables debug mode and auto-reload; anything else runs production settings
+    WORKERS: int = 1  # uvicorn worker processes; only 1 is supported, see _single_worker
     
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://127.0.0.1:8000"]
@@ -23,22 +26,59 @@ class Settings(BaseSettings):
     BASE_DIR: Path = Path(__file__).resolve().parent.parent
     STORAGE_DIR: Path = BASE_DIR / "storage"
     SCRAPED_CONTENT_DIR: Path = STORAGE_DIR / "scraped_content"
+    CONTENT_DB_PATH: Path = STORAGE_DIR / "content.db"  # SQLite store for scraped HTML and markdown
     
     # Model settings
     DEFAULT_MODEL: str = "deepseek/deepseek-chat"
     MAX_TOKENS: int = 32768
     TEMPERATURE: float = 0.2
+    PROMPT_CACHING: bool = True  # mark the static system prefix with cache_control
+    TOKENIZER_MODEL: Optional[str] = None  # HF repo for exact counts on non-OpenAI models, e.g. "deepseek-ai/DeepSeek-V3"
+    
+    # Context memory settings
+    MAX_CHAT_SESSIONS: int = 256  # per-conversation chat states kept in memory, least recently used evicted first
+    MAIN_CONTEXT_BUDGET: int = 48_000  # tokens of full documents kept in the prompt
+    SUMMARY_MODEL: str = "deepseek/deepseek-chat"  # cheap model used to summarize archived documents
+    SUMMARY_MAX_TOKENS: int = 512
+    BYTES_PER_TOKEN: int = 4  # rough markdown bytes per token, for byte caps derived from token budgets
     
     # Scraping settings
     SCRAPER_TIMEOUT: int = 60  # seconds
+    STATIC_FETCH_TIMEOUT: int = 20  # seconds for a plain (unrendered) fetch before falling back to rendering
+    SCRAPER_CONCURRENCY: int = 8  # parallel fetches in a batch scrape
+    PARSER_PROCESSES: Optional[int] = None  # worker processes for HTML conversion; None uses every CPU, 0 converts on executor threads
     MAX_CONTENT_LENGTH: int = 100_000_000  # characters
+    MAX_RAW_HTML_BYTES: int = 5_000_000  # fetched page bytes read before the rest is dropped
+    EXTRACT_MAIN_CONTENT: bool = True  # convert only the extracted article/body instead of the whole page
+    URL_SAVE_DELAY: float = 0.5  # seconds URL shard writes are held back so bursts of scrapes coalesce
+    CONTENT_COMPRESSION_LEVEL: int = 3  # zstd level for scraped documents in the content store
+    SCRAPE_CACHE_TTL: int = 300  # seconds a fetched page is reused across conversations
+    SCRAPE_CACHE_SIZE: int = 32  # fetched pages kept in memory
+    MARKDOWN_CACHE_SIZE: int = 256  # recent conversions kept in memory, keyed by HTML hash
     
-    class Config:
-        case_sensitive = True
-
-# Create global settings instance
-settings = Settings()
+    # Logging
+    LOG_LEVEL: str = "INFO"  # DEBUG logs full messages and document previews
+    
+    # Concurrency settings
+    THREAD_POOL_SIZE: int = 64  # workers for blocking calls offloaded from the event loop
+    
+    model_config = SettingsConfigDict(case_sensitive=True, frozen=True)
+    
+    @field_validator("WORKERS")
+    @classmethod
+    def _single_worker(cls, workers: int) -> int:
+        """Refuse several workers: URL shards, in-flight scrapes, status streams and chat state are per process"""
+        if workers != 1:
+            raise ValueError(
+                "WORKERS must be 1: each worker would rewrite URL shards from its own index, and "
+                "in-flight scrapes, status streams and chat sessions are not shared between processes"
+            )
+        return workers
 
-# Ensure storage directories exist
-os.makedirs(settings.STORAGE_DIR, exist_ok=True)
-os.makedirs(settings.SCRAPED_CONTENT_DIR, exist_ok=True)
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build settings once per process and make sure storage directories exist"""
+    settings = Settings()
+    settings.STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+    settings.SCRAPED_CONTENT_DIR.mkdir(parents=True, exist_ok=True)
+    return settings
@@ -0,0 +1,97 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import sqlite3
+import threading
+import zstandard as zstd
+
+logger = logging.getLogger(__name__)
+
+# (id, kind, compressed data, last_updated), as stored in the content table
+Row = Tuple[str, str, bytes, str]
+
+class ContentStore:
+    """Scraped documents in a single SQLite database, zstd-compressed and keyed by URL entry id.
+
+    WAL mode turns every save into one append to the write-ahead log instead of a
+    file create + write per document. Connections are per thread, since saves and
+    reads run on executor threads.
+    """
+
+    def __init__(self, path: Path, compression_level: int = 3, mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.compression_level = compression_level
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().execute(
+            """
+            CREATE TABLE IF NOT EXISTS content (
+                id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                data BLOB NOT NULL,
+                last_updated TEXT NOT NULL,
+                PRIMARY KEY (id, kind)
+            )
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL stays consistent on power loss with NORMAL; only the last commits can be lost
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Reads are served from a memory map of the database file
+            conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+            self._local.conn = conn
+        return conn
+
+    def save(self, entry_id: str, documents: Dict[str, str]) -> None:
+        """Store documents by kind (e.g. "html", "markdown") for an entry in one transaction"""
+        self.save_many([(entry_id, documents)])
+
+    def save_many(self, entries: Iterable[Tuple[str, Dict[str, str]]], replace: bool = True) -> None:
+        """Store documents for several entries in one transaction, so one WAL commit covers the batch.
+        
+        With replace=False, documents that are already stored are kept.
+        """
+        self.write_rows(self.compress(entries), replace=replace)
+
+    def compress(self, entries: Iterable[Tuple[str, Dict[str, str]]]) -> List[Row]:
+        """Compress documents into rows for write_rows, e.g. on another thread ahead of the write"""
+        # Compressors are not thread-safe, so one per call
+        compressor = zstd.ZstdCompressor(level=self.compression_level)
+        now = datetime.now().isoformat()
+        return [
+            (str(entry_id), kind, compressor.compress(text.encode("utf-8")), now)
+            for entry_id, documents in entries
+            for kind, text in documents.items()
+        ]
+
+    def write_rows(self, rows: List[Row], replace: bool = True) -> None:
+        """Write compressed rows in one transaction"""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+            conn.executemany(f"{verb} INTO content (id, kind, data, last_updated) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self, entry_id: str, kind: str, max_bytes: Optional[int] = None) -> Optional[str]:
+        """Read a document back, decompressing at most max_bytes; None if it was never stored"""
+        row = self._connection().execute(
+            "SELECT data FROM content WHERE id = ? AND kind = ?", (str(entry_id), kind)
+        ).fetchone()
+        if row is None:
+            return None
+        with zstd.ZstdDecompressor().stream_reader(row[0]) as reader:
+            data = reader.read(max_bytes) if max_bytes else reader.readall()
+        # A byte cap can split a multi-byte character at the end
+        return data.decode("utf-8", errors="ignore")
@@ -1,34 +1,70 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.config import settings
+from fastapi.middleware.gzip import GZipMiddleware
+from app.core.config import get_settings
 from app.api.routes.scraper import scraper_router
 from app.api.routes.chat import router as chat_router
+from app.api.dependencies import _scraper_service, scraper_http_client
+from app.services.scraper import PARSE_POOL_CONTEXT
+from app.services.llm import LLM_HTTP_CLIENT
+from app.services.chat import OAI_CLIENT
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from logging.handlers import QueueHandler, QueueListener
+import asyncio
 import logging
+import queue
+import time
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log', mode='a', encoding='utf-8')
-    ]
-)
+settings = get_settings()
+
+# Configure logging: request threads only enqueue records, a background
+# listener thread does the formatting and the console/file writes.
+# `python -m app.main` imports this module twice (as __main__ and as app.main), so
+# nothing is attached to the root logger here; the served app's startup hook does it.
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+file_handler = logging.FileHandler('app.log', mode='a', encoding='utf-8', delay=True)
+file_handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_handler = QueueHandler(log_queue)
+log_listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(settings.LOG_LEVEL)
 
 # Set log levels for specific modules
-logging.getLogger('app.services.chat').setLevel(logging.DEBUG)
-logging.getLogger('app.services.scraper').setLevel(logging.DEBUG)
-logging.getLogger('app.api.routes').setLevel(logging.DEBUG)
+logging.getLogger('app.services.chat').setLevel(settings.LOG_LEVEL)
+logging.getLogger('app.services.scraper').setLevel(settings.LOG_LEVEL)
+logging.getLogger('app.api.routes').setLevel(settings.LOG_LEVEL)
 logging.getLogger('uvicorn').setLevel(logging.INFO)
 logging.getLogger('fastapi').setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """GZip responses except server-sent event streams, which gzip would buffer.
+    
+    streaming_paths are path prefixes, so parameterized stream routes can be listed.
+    """
+    
+    def __init__(self, app, streaming_paths: set, minimum_size: int = 500):
+        super().__init__(app, minimum_size=minimum_size)
+        self.streaming_paths = tuple(streaming_paths)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.streaming_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
-    debug=True  # Enable debug mode
+    debug=settings.ENV == "dev"  # Extra exception middleware only while developing
 )
 
 # Set up CORS
@@ -40,6 +76,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Scraped markdown compresses well; skip the SSE chat and scrape status streams
+app.add_middleware(
+    NonStreamingGZipMiddleware,
+    streaming_paths={f"{settings.API_V1_STR}/chat/message", f"{settings.API_V1_STR}/scraper/events/"},
+    minimum_size=1024
+)
+
+# Dedicated pool for the blocking work handlers offload via run_in_executor(None, ...)
+_executor: Optional[ThreadPoolExecutor] = None
+# Drains log records from the parser worker processes into the same handlers
+parse_log_listener: Optional[QueueListener] = None
+
+@app.on_event("startup")
+async def start_log_listener():
+    """Route log records through the queue and start draining them on a background thread"""
+    root_logger.addHandler(log_handler)
+    log_listener.start()
+
+@app.on_event("startup")
+async def configure_executor():
+    """Install a thread pool sized for IO-bound LLM/scraping calls as the loop default"""
+    global _executor
+    _executor = ThreadPoolExecutor(
+        max_workers=settings.THREAD_POOL_SIZE,
+        thread_name_prefix="api-blocking"
+    )
+    asyncio.get_running_loop().set_default_executor(_executor)
+    logger.info(f"Default executor set to {settings.THREAD_POOL_SIZE} worker threads")
+
+@app.on_event("startup")
+async def start_parse_pool():
+    """Create the HTML conversion worker pool, with the workers' log records written here"""
+    global parse_log_listener
+    parse_log_queue = PARSE_POOL_CONTEXT.Queue()
+    parse_log_listener = QueueListener(parse_log_queue, stream_handler, file_handler, respect_handler_level=True)
+    parse_log_listener.start()
+    _scraper_service.start_parse_pool(parse_log_queue)
+
+@app.on_event("shutdown")
+async def release_resources():
+    """Close the shared HTTP clients and wait for in-flight blocking work to finish"""
+    await scraper_http_client.aclose()
+    await LLM_HTTP_CLIENT.aclose()
+    OAI_CLIENT.close()
+    _scraper_service.shutdown()
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    if parse_log_listener is not None:
+        parse_log_listener.stop()
+    # Flushes any records still queued
+    root_logger.removeHandler(log_handler)
+    log_listener.stop()
+
 # Include routers with proper prefixes
 app.include_router(
     scraper_router,
@@ -64,20 +153,33 @@ async def root():
         "redoc_url": "/redoc"
     }
 
+# Health probes arrive frequently; reuse the formatted timestamp for up to 0.5s
+HEALTH_TIMESTAMP_TTL = 0.5
+_health_timestamp = {"t": float("-inf"), "s": ""}
+
 # Add health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    now = time.monotonic()
+    if now - _health_timestamp["t"] > HEALTH_TIMESTAMP_TTL:
+        _health_timestamp.update(t=now, s=datetime.now().isoformat())
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _health_timestamp["s"]
     }
 
 if __name__ == "__main__":
     import uvicorn
+    is_dev = settings.ENV == "dev"
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=is_dev,
+        # Settings refuse WORKERS != 1; all service state lives in this one process
+        workers=settings.WORKERS,
+        loop="uvloop",
+        http="httptools",
+        access_log=is_dev
     )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 from uuid import UUID, uuid4
@@ -17,9 +17,22 @@ class Conversation(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
 
 class ChatRequest(BaseModel):
-    conversation_id: Optional[UUID] = None
+    model_config = ConfigDict(extra="forbid")
+
+    conversation_id: Optional[str] = None
     message: str
 
+class ClearContextRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    conversation_id: Optional[str] = None
+
+class ContextBatchRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    ids: List[UUID]
+    max_concurrency: int = Field(default=5, ge=1)
+
 class ChatResponse(BaseModel):
     conversation_id: UUID
     message: Message
@@ -1,6 +1,6 @@
 from enum import Enum
-from pydantic import BaseModel, UUID4
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, TypeAdapter, UUID4
+from typing import List, Optional
 from uuid import UUID
 
 class URLStatus(str, Enum):
@@ -10,18 +10,35 @@ class URLStatus(str, Enum):
     ERROR = "error"
 
 class URLEntry(BaseModel):
+    # Entries are mutated in place while scraping; don't re-validate on every assignment
+    model_config = ConfigDict(extra="ignore", validate_assignment=False)
+
     id: UUID
     url: str
     status: URLStatus
     conversation_id: str
+    # Page bodies live in the content store; only filled on content endpoint responses
     raw_content: Optional[str] = None  # Initial markdown content
     content: Optional[str] = None      # LLM-cleaned content
+    token_count: Optional[int] = None  # Tokens in content, cached so re-adding skips tokenization
     error: Optional[str] = None
 
 class ScrapeRequest(BaseModel):
     url: str
     conversation_id: str
     force_refresh: bool = False
+    render: Optional[bool] = None  # Headless-browser fetch; None tries a plain fetch first
 
 class ScrapeResponse(BaseModel):
     url_entry: URLEntry
+
+class ScrapeBatchRequest(BaseModel):
+    requests: List[ScrapeRequest]
+
+class ScrapeBatchResponse(BaseModel):
+    responses: List[ScrapeResponse]  # In request order
+
+# Compiled once; used for list responses and bulk (de)serialization
+URLEntryList = TypeAdapter(List[URLEntry])
+# Page bodies, left out of every list item in shards and conversation listings
+ENTRY_BODY_EXCLUDE = {"__all__": {"raw_content", "content"}}
@@ -1,53 +1,178 @@
-from transformers import AutoTokenizer
+import httpx
 import openai
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+from functools import lru_cache
+from itertools import chain
 import logging
-from app.core.config import settings
+from app.core.config import get_settings
 from app.models.scraper import URLEntry
+from app.services.tokenizer import get_encoding
+from app.services.llm import LLM_HTTP_CLIENT, content_digest, llm_service
+from pathlib import Path
+from functools import partial
+import asyncio
+import hashlib
+import json
 import re
+import threading
+
+settings = get_settings()
 
 logger = logging.getLogger(__name__)
 
 # Create client
+# Keep-alive pool for the sync completions that run on executor threads (the async paths
+# use LLM_HTTP_CLIENT). Sized like that pool so concurrent conversations don't queue for
+# a connection; timeouts stay the openai client's per-request defaults. Closed on app shutdown.
+OAI_HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+)
+
 OAI_CLIENT = openai.OpenAI(
-    base_url = "https://openrouter.ai/api/v1",
+    base_url = settings.OPENROUTER_BASE_URL,
     api_key = settings.OPENROUTER_API_KEY,
+    default_headers = {"anthropic-beta": "prompt-caching-2024-07-31"},
+    http_client = OAI_HTTP_CLIENT,
 )
 
-def get_llm_response(messages: List[Dict[str, str]], model_name: str):
-    logger.debug(f"Sending request to LLM with {len(messages)} messages")
-    logger.debug("Messages being sent to LLM:")
-    for i, msg in enumerate(messages):
-        logger.debug(f"Message {i}: {msg['role']} - {msg['content'][:200]}...")
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Empty documents section; rendered byte-for-byte the same whether fresh or after clearing,
+# so the system prompt (and the provider's prompt cache) is stable across calls
+DOCUMENTS_SENTINEL = "<documents>\n</documents>"
+
+# Legacy marker some older prompts used for scraped data; only checked when debugging
+SCRAPED_PAGES_PATTERN = re.compile(r'\[SCRAPED_PAGES_DATA\](.*?)\[/SCRAPED_PAGES_DATA\]', re.DOTALL)
+
+# Emitted by the model when it needs the full text of an archived document
+RECALL_PATTERN = re.compile(r'<recall\s+url="([^"]+)"\s*/?>')
+RECALL_PREFIX = "<recall"
+MAX_RECALLS_PER_MESSAGE = 2
+
+SUMMARY_PROMPT = """Summarize the following scraped webpage so it can stand in for the full text in a sports betting analysis conversation. Keep every key statistic, score, injury, line and date; drop everything else. Respond with the summary only.
+
+<document>
+{content}
+</document>"""
+
+def get_llm_response(
+    messages: List[Dict],
+    model_name: str,
+    max_tokens: int = 1536,
+    temperature: float = 0.4
+):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Sending request to LLM with {len(messages)} messages")
+        logger.debug("Messages being sent to LLM:")
+        for i, msg in enumerate(messages):
+            content = msg['content']
+            if isinstance(content, list):
+                content = "".join(block["text"] for block in content)
+            logger.debug(f"Message {i}: {msg['role']} - {content[:200]}...")
     
     chat_completion = OAI_CLIENT.chat.completions.create(
         model=model_name,
         messages=messages,
-        max_tokens=1536,
-        temperature=0.4
+        max_tokens=max_tokens,
+        temperature=temperature
     )
     logger.debug(f"Received response from LLM: {len(chat_completion.choices[0].message.content)} chars")
     return chat_completion
 
+class LLMStream:
+    """Content deltas of a streamed chat completion; usage is filled in once the stream is exhausted"""
+    
+    def __init__(self, completion_stream):
+        self._stream = completion_stream
+        self.usage = None
+    
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._stream:
+            # The usage chunk arrives last, with no choices
+            usage = getattr(chunk, "usage", None)
+            if usage:
+                # Not a declared chunk field in this openai version, so it may arrive as a plain dict
+                self.usage = usage if isinstance(usage, dict) else usage.model_dump()
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def join(self) -> str:
+        """Consume the whole stream, for callers that only want the final text"""
+        return "".join(self)
+
+def stream_llm_response(
+    messages: List[Dict],
+    model_name: str,
+    max_tokens: int = 1536,
+    temperature: float = 0.4
+) -> LLMStream:
+    """Like get_llm_response, but the completion is streamed as it is generated"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Streaming request to LLM with {len(messages)} messages")
+    
+    completion_stream = OAI_CLIENT.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        # Not a named parameter in this openai version, so it is passed through the body
+        extra_body={"stream_options": {"include_usage": True}}
+    )
+    return LLMStream(completion_stream)
+
+def completion_tokens_from_usage(usage: Optional[Dict]) -> Optional[int]:
+    """Completion token count reported by the provider, logging prompt cache hits along the way"""
+    if not usage:
+        return None
+    if logger.isEnabledFor(logging.INFO):
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        logger.info(f"LLM usage: prompt={usage.get('prompt_tokens')} cached={cached_tokens} "
+                    f"completion={usage.get('completion_tokens')}")
+    return usage.get("completion_tokens")
+
+def documents_span(system: str) -> Optional[Tuple[int, int]]:
+    """Locate the <documents>...</documents> section as (start, end) offsets, or None if missing"""
+    start = system.find("<documents>")
+    if start < 0:
+        return None
+    end = system.find("</documents>", start)
+    if end < 0:
+        return None
+    return start, end + len("</documents>")
+
+@lru_cache(maxsize=8)
+def prime_system_prompt(model: str, system: str) -> Tuple[int, ...]:
+    """Tokenize a system prompt template once per process; every ChatService reuses the ids"""
+    return tuple(get_encoding(model).encode(system, disallowed_special=()))
+
 class ChatService:
-    def __init__(self, model: str, tok_model: str, system: str = ""):
-        logger.info(f"Initializing ChatService with model={model}, tokenizer={tok_model}")
-        logger.info("=== FULL SYSTEM MESSAGE AT INIT START ===")
-        logger.info(system)
-        logger.info("=== END FULL SYSTEM MESSAGE ===")
+    def __init__(self, model: str, system: str = "", conversation_id: str = "default"):
+        logger.info(f"Initializing ChatService with model={model}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== FULL SYSTEM MESSAGE AT INIT START ===")
+            logger.info(system)
+            logger.info("=== END FULL SYSTEM MESSAGE ===")
         
         # Ensure system message has proper documents section
-        if "<documents>" not in system or "</documents>" not in system:
+        span = documents_span(system)
+        if span is None:
             logger.warning("System message missing documents tags, adding them")
             # Find the end of the main system prompt
             if system:
-                system = system.rstrip() + "\n\n<documents>\n</documents>"
+                system = system.rstrip() + "\n\n" + DOCUMENTS_SENTINEL
             else:
-                system = "<documents>\n</documents>"
+                system = DOCUMENTS_SENTINEL
+            span = (len(system) - len(DOCUMENTS_SENTINEL), len(system))
         
         self.system = system
+        # Archived documents are stored per conversation, so two conversations never share files
+        self.conversation_id = conversation_id
+        # Offsets of the documents section in self.system, kept current on every rebuild
+        self._documents_span = span
         self.model = model
-        self.tokenizer = AutoTokenizer.from_pretrained(tok_model)
+        self.tokenizer = get_encoding(model)
         self.max_message_tokens = 65536
 
         self.purged_messages = []
@@ -58,233 +183,604 @@ class ChatService:
         
         # Store scraped content separately
         self.scraped_content = {}
+        
+        # Two-tier document memory: full documents live in the main context up to
+        # MAIN_CONTEXT_BUDGET tokens; older ones are archived to disk and only their
+        # summary stays in the prompt until the model recalls them.
+        self.archived_content: Dict[str, str] = {}
+        self._doc_tokens: Dict[str, int] = {}
+        self._main_context_tokens = 0
+        # Tokens of each rendered <document> block, so the system prompt total is a sum, not a re-encode
+        self._doc_token_counts: Dict[str, int] = {}
+        # Stable per-URL document indexes, so adding or removing one document never rewrites the others
+        self._doc_ids: Dict[str, int] = {}
+        self._next_doc_id = 1
+        # Rendered <document> blocks, dropped whenever the document changes
+        self._doc_fragments: Dict[str, str] = {}
+        # Evictions still being summarized: url -> generation. Re-adding, removing or clearing
+        # a document drops its entry, so a summary that finishes afterwards is discarded.
+        self._pending_archives: Dict[str, int] = {}
+        self._archive_generation = 0
+        
+        # System message split into cacheable blocks, rebuilt only when the prompt string changes
+        self._system_message_cache: Tuple[Optional[str], Optional[Dict]] = (None, None)
+        
+        # Requests for the same conversation run on different executor threads
+        self._lock = threading.RLock()
 
         if self.system:
             logger.info("Adding system prompt to messages")
+            self._prime_system_prompt()
             self.messages.append({"role": "system", "content": system})
-            self.messages_token_counts.append(len(self.tokenizer.encode(system)))
-            self.total_messages_tokens = len(self.tokenizer.encode(system))
+            self.messages_token_counts.append(self._system_token_len)
+            self.total_messages_tokens = self._system_token_len
             logger.debug(f"System prompt tokens: {self.messages_token_counts[-1]}")
             self.verify_system_content("AFTER_INIT")
     
+    def _prime_system_prompt(self) -> None:
+        """Reuse the process-wide tokenization of the system prompt template.
+        
+        The template carries an empty documents section, so its length is the base that
+        per-document block counts are added to.
+        """
+        self._system_token_ids = prime_system_prompt(self.model, self.system)
+        self._system_token_len = len(self._system_token_ids)
+    
+    def _count_tokens(self, text: str) -> int:
+        """Count tokens with the model's encoding"""
+        return len(self.tokenizer.encode(text, disallowed_special=()))
+    
+    def _request_messages(self) -> List[Dict]:
+        """Build the message list sent to the LLM, marking the system prompt as cacheable.
+        
+        Two cache breakpoints: everything before <documents> is fixed for the lifetime of
+        the service, and the documents block only changes on context updates, so turns
+        between updates read the whole system prompt from the provider's cache.
+        """
+        if not settings.PROMPT_CACHING or not self.messages or self.messages[0]["role"] != "system":
+            return list(self.messages)
+        
+        system = self.messages[0]["content"]
+        cached_source, cached_message = self._system_message_cache
+        if cached_source is not system:
+            cached_message = self._build_system_message(system)
+            self._system_message_cache = (system, cached_message)
+        if cached_message is None:
+            return list(self.messages)
+        return [cached_message] + self.messages[1:]
+    
+    @staticmethod
+    def _build_system_message(system: str) -> Optional[Dict]:
+        """Split the system prompt into cache_control content blocks, or None if it has no documents section"""
+        split_at = system.find("<documents>")
+        if split_at <= 0:
+            return None
+        return {
+            "role": "system",
+            "content": [
+                {"type": "text", "text": system[:split_at], "cache_control": CACHE_CONTROL},
+                {"type": "text", "text": system[split_at:], "cache_control": CACHE_CONTROL},
+            ]
+        }
+    
+    def _documents_span_intact(self) -> bool:
+        """Check the cached offsets still frame the documents section, without rescanning the prompt"""
+        if self._documents_span is None:
+            return False
+        start, end = self._documents_span
+        return self.system.startswith("<documents>", start) and self.system.endswith("</documents>", 0, end)
+    
+    @staticmethod
+    def _render_document(idx: int, url: str, body: str, archived: bool = False) -> str:
+        """Render one <document> block; archived documents carry a summary instead of the content"""
+        if archived:
+            return (
+                f'  <document index="{idx}" archived="true">\n'
+                f'    <source>{url}</source>\n'
+                f'    <summary>\n      {body}\n    </summary>\n'
+                '  </document>'
+            )
+        return (
+            f'  <document index="{idx}">\n'
+            f'    <source>{url}</source>\n'
+            f'    <document_content>\n      {body}\n    </document_content>\n'
+            '  </document>'
+        )
+    
+    def _block_tokens(self, url: str, body_tokens: int, archived: bool = False) -> int:
+        """Tokens of a rendered document block: the known body count plus its small XML wrapper"""
+        return body_tokens + self._count_tokens(self._render_document(0, url, "", archived) + "\n")
+    
     def _update_system_message(self) -> None:
         """Update system message with current scraped content"""
         logger.info("=== UPDATING SYSTEM MESSAGE START ===")
-        logger.info(f"Current number of scraped documents: {len(self.scraped_content)}")
+        logger.info("Current number of scraped documents: %d", len(self.scraped_content))
         
-        # Split system message into parts using regex to preserve all content
-        pattern = r'(<documents>.*?</documents>)'
-        parts = re.split(pattern, self.system, flags=re.DOTALL)
-        
-        if len(parts) != 3:  # Should be: [before, documents section, after]
-            logger.error(f"Invalid system message structure. Got {len(parts)} parts, expected 3")
+        # Slice around the cached documents offsets to preserve everything else
+        if not self._documents_span_intact():
+            logger.error("Invalid system message structure: no documents section")
             logger.error(f"System message preview: {self.system[:200]}...")
             return
             
-        before_docs, _, after_docs = parts
-        
-        # Combine all scraped content in XML format
-        documents_content = ""
-        for idx, (url, content) in enumerate(self.scraped_content.items(), 1):
-            logger.debug(f"Processing document {idx} from URL: {url}")
-            if documents_content:
-                documents_content += "\n"
-            documents_content += f'  <document index="{idx}">\n'
-            documents_content += f'    <source>{url}</source>\n'
-            documents_content += f'    <document_content>\n      {content}\n    </document_content>\n'
-            documents_content += '  </document>'
+        start, end = self._documents_span
+        before_docs, after_docs = self.system[:start], self.system[end:]
+        
+        # Full documents first, then archived ones, which only carry their summary
+        documents = chain(
+            ((url, content, False) for url, content in self.scraped_content.items()),
+            ((url, summary, True) for url, summary in self.archived_content.items())
+        )
+        fragments = []
+        for url, body, archived in documents:
+            fragment = self._doc_fragments.get(url)
+            if fragment is None:
+                fragment = self._render_document(self._doc_id(url), url, body, archived)
+                self._doc_fragments[url] = fragment
+            fragments.append(fragment)
+        documents_content = "\n".join(fragments)
         
         # Create new system message preserving content before and after documents
-        new_system = f"{before_docs}<documents>\n{documents_content}\n</documents>{after_docs}"
+        if documents_content:
+            new_system = f"{before_docs}<documents>\n{documents_content}\n</documents>{after_docs}"
+        else:
+            new_system = f"{before_docs}{DOCUMENTS_SENTINEL}{after_docs}"
         
-        # Update system property
+        # Update system property; the section still starts where it did
         self.system = new_system
+        self._documents_span = (start, len(new_system) - len(after_docs))
         
         # Update in messages list
         if self.messages and self.messages[0]["role"] == "system":
             prev_tokens = self.messages_token_counts[0]
             self.messages[0]["content"] = new_system
-            # Recalculate token count
-            new_tokens = len(self.tokenizer.encode(new_system))
+            # Base template plus the cached per-document counts; nothing is re-encoded here
+            new_tokens = self._system_token_len + sum(self._doc_token_counts.values())
             self.messages_token_counts[0] = new_tokens
-            self.total_messages_tokens = sum(self.messages_token_counts)
-            logger.info(f"Token count changed from {prev_tokens} to {new_tokens}")
+            # The running total is the source of truth; only the system message changed
+            self.total_messages_tokens += new_tokens - prev_tokens
+            if __debug__:
+                assert self.total_messages_tokens == sum(self.messages_token_counts), "token total drifted"
+            logger.info("Token count changed from %d to %d", prev_tokens, new_tokens)
         
-        logger.info("=== UPDATING SYSTEM MESSAGE END ===")
-        logger.info(f"Updated system message preview: {new_system[:200]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== UPDATING SYSTEM MESSAGE END ===")
+            logger.info(f"Updated system message preview: {new_system[:200]}...")
     
-    def update_context(self, url: str, content: str) -> None:
-        """Add or update content in the conversation context"""
+    def _archive_path(self, url: str) -> Path:
+        """Location of the full text of an archived document, under this conversation's directory"""
+        # Conversation ids come from clients, so both path parts are hashed
+        conversation_hash = hashlib.sha256(self.conversation_id.encode("utf-8")).hexdigest()[:16]
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return settings.SCRAPED_CONTENT_DIR / conversation_hash / f"{url_hash}.md"
+    
+    def _delete_archives(self, urls: List[str]) -> None:
+        """Remove archived documents' files; called under the lock so a concurrent archive can't be deleted"""
+        for url in urls:
+            try:
+                self._archive_path(url).unlink(missing_ok=True)
+            except OSError as e:
+                logger.error(f"Error deleting archived content for URL {url}: {e}")
+    
+    def _doc_id(self, url: str) -> int:
+        """Index a URL is rendered with; assigned on first insert and kept through archive and recall"""
+        doc_id = self._doc_ids.get(url)
+        if doc_id is None:
+            doc_id = self._doc_ids[url] = self._next_doc_id
+            self._next_doc_id += 1
+        return doc_id
+    
+    def _forget_document(self, url: str) -> None:
+        """Drop a document (full or archived) from the main context accounting"""
+        self.scraped_content.pop(url, None)
+        self.archived_content.pop(url, None)
+        self._main_context_tokens -= self._doc_tokens.pop(url, 0)
+        self._doc_token_counts.pop(url, None)
+        self._doc_fragments.pop(url, None)
+        self._pending_archives.pop(url, None)
+    
+    def _select_evictions(self) -> List[tuple]:
+        """Pop the oldest full documents until the main context fits its budget"""
+        evicted = []
+        while self._main_context_tokens > settings.MAIN_CONTEXT_BUDGET and len(self.scraped_content) > 1:
+            url = next(iter(self.scraped_content))
+            content = self.scraped_content[url]
+            self._forget_document(url)
+            self._archive_generation += 1
+            self._pending_archives[url] = self._archive_generation
+            evicted.append((url, content, self._archive_generation))
+        if self._main_context_tokens > settings.MAIN_CONTEXT_BUDGET:
+            logger.warning(f"Single document exceeds main context budget: {self._main_context_tokens} tokens")
+        return evicted
+    
+    def _summarize(self, content: str) -> str:
+        """Condense a document with one cheap LLM call, reusing the stored summary of unchanged content"""
+        digest = content_digest(content)
+        store = llm_service.cache_store
+        if store is not None:
+            try:
+                cached = store.load(digest, "summary")
+            except Exception as e:
+                logger.error(f"Error loading cached summary: {e}")
+                cached = None
+            if cached is not None:
+                return cached
+        try:
+            completion = get_llm_response(
+                messages=[{"role": "user", "content": SUMMARY_PROMPT.format(content=content)}],
+                model_name=settings.SUMMARY_MODEL,
+                max_tokens=settings.SUMMARY_MAX_TOKENS,
+                temperature=0.0
+            )
+            summary = completion.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing document: {str(e)}", exc_info=True)
+            # Fall back to the head of the document so the model still sees something
+            return content[:2000]
+        # Best effort; the frontend re-adds every URL on each context change, so this saves repeat calls
+        if store is not None:
+            try:
+                store.save(digest, {"summary": summary})
+            except Exception as e:
+                logger.error(f"Error caching summary: {e}")
+        return summary
+    
+    def _archive_document(self, url: str, content: str, generation: int) -> None:
+        """Move a document to external storage, keeping only its summary in context"""
+        logger.info(f"Archiving document from URL: {url}")
+        summary = self._summarize(content)
+        summary_tokens = self._count_tokens(summary)
+        block_tokens = self._block_tokens(url, summary_tokens, archived=True)
+        with self._lock:
+            # The URL may have been re-added, removed or cleared while we were summarizing
+            if self._pending_archives.get(url) != generation:
+                logger.info(f"Discarding stale archive of URL: {url}")
+                return
+            del self._pending_archives[url]
+            # Written under the lock, so remove/clear always see either no file or the final one
+            path = self._archive_path(url)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding="utf-8")
+            self.archived_content[url] = summary
+            self._doc_tokens[url] = summary_tokens
+            self._doc_token_counts[url] = block_tokens
+            self._main_context_tokens += summary_tokens
+    
+    def update_context(self, url: str, content: str, token_count: Optional[int] = None) -> None:
+        """Add or update content in the conversation context.
+        
+        token_count may be passed when already known (see URLEntry.token_count) to skip re-tokenizing.
+        """
         if not content:
             logger.warning(f"No content to add for URL: {url}")
             return
             
         logger.info(f"Adding/updating content from URL: {url}")
+        content_tokens = token_count if token_count is not None else self._count_tokens(content)
+        block_tokens = self._block_tokens(url, content_tokens)
+        
+        with self._lock:
+            # Store content
+            self._forget_document(url)
+            self._doc_id(url)
+            self.scraped_content[url] = content
+            self._doc_tokens[url] = content_tokens
+            self._doc_token_counts[url] = block_tokens
+            self._main_context_tokens += content_tokens
+            evicted = self._select_evictions()
         
-        # Store content
-        self.scraped_content[url] = content
+        # Summaries are LLM calls, so they run without holding the lock
+        for evicted_url, evicted_content, generation in evicted:
+            self._archive_document(evicted_url, evicted_content, generation)
         
-        # Update system message
-        self._update_system_message()
+        with self._lock:
+            # Update system message
+            self._update_system_message()
         
-        logger.info("=== FINAL CONTEXT UPDATE VERIFICATION ===")
-        logger.info(f"Current scraped content URLs: {list(self.scraped_content.keys())}")
-        logger.info(f"System message preview: {self.system[:200]}...")
-        if self.messages:
-            logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
-        logger.info("=== END CONTEXT UPDATE VERIFICATION ===")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== FINAL CONTEXT UPDATE VERIFICATION ===")
+            logger.info(f"Current scraped content URLs: {list(self.scraped_content.keys())}")
+            logger.info(f"Archived content URLs: {list(self.archived_content.keys())}")
+            logger.info(f"Main context tokens: {self._main_context_tokens}")
+            logger.info(f"System message preview: {self.system[:200]}...")
+            if self.messages:
+                logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
+            logger.info("=== END CONTEXT UPDATE VERIFICATION ===")
+    
+    def recall(self, url: str) -> bool:
+        """Bring an archived document back into the main context"""
+        with self._lock:
+            if url not in self.archived_content:
+                return False
+        path = self._archive_path(url)
+        if not path.exists():
+            logger.warning(f"Archived content missing on disk for URL: {url}")
+            return False
+        logger.info(f"Recalling archived document from URL: {url}")
+        self.update_context(url, path.read_text(encoding="utf-8"))
+        return True
     
     def remove_url_content(self, url: str) -> None:
-        """Remove content from a specific URL in the scraped pages data section"""
+        """Remove content from a specific URL in the scraped pages data section.
+        
+        Cheap enough to call directly from the event loop; the lock is never held across LLM calls.
+        """
         if not url:
             return
 
         logger.info(f"Removing content for URL: {url}")
         
         # Remove content
-        if url in self.scraped_content:
-            del self.scraped_content[url]
-            
-            # Update system message
-            self._update_system_message()
-            
-            logger.info("=== FINAL REMOVE URL VERIFICATION ===")
-            logger.info(f"Current scraped content URLs: {list(self.scraped_content.keys())}")
-            logger.info(f"System message preview: {self.system[:200]}...")
-            if self.messages:
-                logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
-            logger.info("=== END FINAL REMOVE URL VERIFICATION ===")
+        with self._lock:
+            removed = url in self.scraped_content or url in self.archived_content
+            # An eviction of this URL may still be summarizing; forgetting it discards the result
+            self._pending_archives.pop(url, None)
+            if removed:
+                self._forget_document(url)
+                self._doc_ids.pop(url, None)
+                # A recalled document may still have its archive file on disk
+                self._delete_archives([url])
+                # Update system message
+                self._update_system_message()
+        
+        if removed:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("=== FINAL REMOVE URL VERIFICATION ===")
+                logger.info(f"Current scraped content URLs: {list(self.scraped_content.keys())}")
+                logger.info(f"System message preview: {self.system[:200]}...")
+                if self.messages:
+                    logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
+                logger.info("=== END FINAL REMOVE URL VERIFICATION ===")
         else:
             logger.warning(f"URL {url} not found in scraped content")
     
     def process_message(self, message: str) -> str:
         logger.info("Processing new message")
-        logger.info("=== PROCESS MESSAGE START STATE ===")
-        logger.info(f"System message preview: {self.system[:200]}...")
-        if self.messages:
-            logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
-        logger.info("=== END PROCESS MESSAGE START STATE ===")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== PROCESS MESSAGE START STATE ===")
+            logger.info(f"System message preview: {self.system[:200]}...")
+            if self.messages:
+                logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
+            logger.info("=== END PROCESS MESSAGE START STATE ===")
         
         # Ensure system message is intact
-        pattern = r'(<documents>.*?</documents>)'
-        if not re.search(pattern, self.system, re.DOTALL):
+        if not self._documents_span_intact():
             logger.error("System message corrupted, attempting to restore from messages list")
             if self.messages and self.messages[0]["role"] == "system":
                 self.system = self.messages[0]["content"]
+                self._documents_span = documents_span(self.system)
             else:
                 logger.error("Could not restore system message!")
                 return "Error: System message corrupted"
         
+        return "".join(self.stream_message(message))
+    
+    def stream_message(self, message: str) -> Iterator[str]:
+        """Yield the reply to a message as it is generated, recording it in history once complete.
+        
+        The blocking counterpart of astream_message; meant to run on a worker thread.
+        """
         # Add user message
         logger.info("Adding user message")
-        self.messages.append({"role": "user", "content": message})
-        message_tokens = len(self.tokenizer.encode(message))
-        self.messages_token_counts.append(message_tokens)
-        self.total_messages_tokens += message_tokens
+        message_tokens = self._count_tokens(message)
+        with self._lock:
+            self.messages.append({"role": "user", "content": message})
+            self.messages_token_counts.append(message_tokens)
+            self.total_messages_tokens += message_tokens
+            # Snapshot under the lock; the LLM call itself runs without holding it
+            request_messages = self._request_messages()
         logger.debug(f"Added user message with {message_tokens} tokens")
         
         # Get response from LLM
         logger.info("Getting response from LLM")
-        completion = get_llm_response(messages=self.messages, model_name=self.model)
-        response = completion.choices[0].message.content
+        for attempt in range(MAX_RECALLS_PER_MESSAGE + 1):
+            parts = []
+            streaming = False
+            stream = stream_llm_response(messages=request_messages, model_name=self.model)
+            for delta in stream:
+                parts.append(delta)
+                if not streaming:
+                    # Hold output back while it could still be a <recall url="..."/> request
+                    head = "".join(parts).lstrip()
+                    if RECALL_PREFIX.startswith(head) or head.startswith(RECALL_PREFIX):
+                        continue
+                    streaming = True
+                    delta = "".join(parts)
+                yield delta
+            response = "".join(parts)
+            if streaming:
+                break
+            
+            # The model may ask for the full text of an archived document before answering
+            match = RECALL_PATTERN.search(response)
+            if not match or attempt == MAX_RECALLS_PER_MESSAGE or not self.recall(match.group(1)):
+                if response:
+                    yield response
+                break
+            with self._lock:
+                request_messages = self._request_messages()
         
-        # Add assistant response
+        # Add assistant response; the provider already counted its tokens
         logger.info("Adding assistant response")
-        self.messages.append({"role": "assistant", "content": response})
-        response_tokens = len(self.tokenizer.encode(response))
-        self.messages_token_counts.append(response_tokens)
-        self.total_messages_tokens += response_tokens
+        response_tokens = completion_tokens_from_usage(stream.usage)
+        if response_tokens is None:
+            response_tokens = self._count_tokens(response)
+        with self._lock:
+            self.messages.append({"role": "assistant", "content": response})
+            self.messages_token_counts.append(response_tokens)
+            self.total_messages_tokens += response_tokens
         logger.debug(f"Added assistant response with {response_tokens} tokens")
+    
+    async def _astream_completion(self, messages: List[Dict], usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Yield content deltas from a streamed OpenRouter chat completion.
+        
+        If a usage dict is passed, it is filled with the final usage chunk.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 1536,
+            "temperature": 0.4,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        async with LLM_HTTP_CLIENT.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # OpenRouter interleaves ": OPENROUTER PROCESSING" keep-alive comments
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if usage is not None and chunk.get("usage"):
+                    usage.update(chunk["usage"])
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+    
+    async def astream_message(self, message: str) -> AsyncIterator[str]:
+        """Stream the reply to a message as it is generated, recording it in history once complete"""
+        logger.info("Streaming response for new message")
+        message_tokens = self._count_tokens(message)
+        with self._lock:
+            self.messages.append({"role": "user", "content": message})
+            self.messages_token_counts.append(message_tokens)
+            self.total_messages_tokens += message_tokens
+            request_messages = self._request_messages()
+        logger.debug(f"Added user message with {message_tokens} tokens")
+        
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RECALLS_PER_MESSAGE + 1):
+            parts = []
+            streaming = False
+            usage = {}
+            async for delta in self._astream_completion(request_messages, usage):
+                parts.append(delta)
+                if not streaming:
+                    # Hold output back while it could still be a <recall url="..."/> request
+                    head = "".join(parts).lstrip()
+                    if RECALL_PREFIX.startswith(head) or head.startswith(RECALL_PREFIX):
+                        continue
+                    streaming = True
+                    delta = "".join(parts)
+                yield delta
+            response = "".join(parts)
+            if streaming:
+                break
+            
+            match = RECALL_PATTERN.search(response)
+            recalled = (
+                match is not None
+                and attempt < MAX_RECALLS_PER_MESSAGE
+                # Recalling may summarize evicted documents, which is a blocking LLM call
+                and await loop.run_in_executor(None, partial(self.recall, match.group(1)))
+            )
+            if not recalled:
+                if response:
+                    yield response
+                break
+            with self._lock:
+                request_messages = self._request_messages()
         
-        return response
+        response_tokens = completion_tokens_from_usage(usage)
+        if response_tokens is None:
+            response_tokens = self._count_tokens(response)
+        with self._lock:
+            self.messages.append({"role": "assistant", "content": response})
+            self.messages_token_counts.append(response_tokens)
+            self.total_messages_tokens += response_tokens
+        logger.debug(f"Added assistant response with {response_tokens} tokens")
     
     def execute(self):
-        logger.info("=== EXECUTE DEBUG ===")
-        if self.messages and self.messages[0]["role"] == "system":
-            pattern = r'\[SCRAPED_PAGES_DATA\](.*?)\[/SCRAPED_PAGES_DATA\]'
-            match = re.search(pattern, self.messages[0]["content"], re.DOTALL)
+        if logger.isEnabledFor(logging.DEBUG) and self.messages and self.messages[0]["role"] == "system":
+            match = SCRAPED_PAGES_PATTERN.search(self.messages[0]["content"])
             if match:
-                logger.info(f"Found scraped pages content before LLM call: '{match.group(1)}'")
+                logger.debug(f"Found scraped pages content before LLM call: '{match.group(1)}'")
             else:
-                logger.error("No scraped pages content found before LLM call!")
-        logger.info("=== END EXECUTE DEBUG ===")
+                logger.debug("No scraped pages content found before LLM call")
         
         logger.debug(f"Executing LLM call with {len(self.messages)} messages")
-        completion = get_llm_response(messages=self.messages, model_name=self.model)
+        completion = get_llm_response(messages=self._request_messages(), model_name=self.model)
         return completion
 
     def rolling_memory(self):
-        logger.info("=== ROLLING MEMORY DEBUG ===")
+        debug = logger.isEnabledFor(logging.DEBUG)
         # Check content before memory management
-        if self.messages and self.messages[0]["role"] == "system":
-            pattern = r'\[SCRAPED_PAGES_DATA\](.*?)\[/SCRAPED_PAGES_DATA\]'
-            match = re.search(pattern, self.messages[0]["content"], re.DOTALL)
+        if debug and self.messages and self.messages[0]["role"] == "system":
+            match = SCRAPED_PAGES_PATTERN.search(self.messages[0]["content"])
             if match:
-                logger.info(f"Found scraped pages content before memory cleanup: '{match.group(1)}'")
+                logger.debug(f"Found scraped pages content before memory cleanup: '{match.group(1)}'")
             else:
-                logger.error("No scraped pages content found before memory cleanup!")
+                logger.debug("No scraped pages content found before memory cleanup")
         
         if self.total_messages_tokens >= self.max_message_tokens:
             logger.info("Starting memory management")
             logger.debug(f"Current total tokens: {self.total_messages_tokens}")
             logger.debug(f"Max tokens allowed: {self.max_message_tokens}")
         
-        while self.total_messages_tokens >= self.max_message_tokens:
-            # Don't remove system message or initial context
-            if len(self.messages) <= 2:
-                logger.warning("Cannot remove more messages - reached system/context messages")
-                break
-                
-            # Remove oldest non-system messages
-            removed_message = self.messages.pop(2)  # Start from index 2 to preserve system and context
-            removed_tokens = self.messages_token_counts.pop(2)
+        with self._lock:
+            # Find how many of the oldest non-system messages to drop in one pass, then
+            # delete them as a single slice instead of shifting the list once per message
+            start = end = 2  # Start from index 2 to preserve system and context
+            removed_tokens = 0
+            while (self.total_messages_tokens - removed_tokens >= self.max_message_tokens
+                   and end < len(self.messages)):
+                removed_tokens += self.messages_token_counts[end]
+                end += 1
             
-            self.purged_messages.append(removed_message)
-            self.purged_messages_token_count.append(removed_tokens)
-            self.total_messages_tokens -= removed_tokens
+            if end > start:
+                self.purged_messages.extend(self.messages[start:end])
+                self.purged_messages_token_count.extend(self.messages_token_counts[start:end])
+                del self.messages[start:end]
+                del self.messages_token_counts[start:end]
+                self.total_messages_tokens -= removed_tokens
+                logger.debug(f"Removed {end - start} messages ({removed_tokens} tokens)")
+                logger.debug(f"New total tokens: {self.total_messages_tokens}")
             
-            logger.debug(f"Removed message: {removed_message.get('role')} ({removed_tokens} tokens)")
-            logger.debug(f"New total tokens: {self.total_messages_tokens}")
+            if self.total_messages_tokens >= self.max_message_tokens and len(self.messages) <= 2:
+                # Don't remove system message or initial context
+                logger.warning("Cannot remove more messages - reached system/context messages")
         
         # Check content after memory management
-        if self.messages and self.messages[0]["role"] == "system":
-            match = re.search(pattern, self.messages[0]["content"], re.DOTALL)
+        if debug and self.messages and self.messages[0]["role"] == "system":
+            match = SCRAPED_PAGES_PATTERN.search(self.messages[0]["content"])
             if match:
-                logger.info(f"Found scraped pages content after memory cleanup: '{match.group(1)}'")
+                logger.debug(f"Found scraped pages content after memory cleanup: '{match.group(1)}'")
             else:
-                logger.error("No scraped pages content found after memory cleanup!")
+                logger.debug("No scraped pages content found after memory cleanup")
         
         if self.total_messages_tokens >= self.max_message_tokens:
             logger.warning("Memory management complete but still at token limit")
-        
-        logger.info("=== END ROLLING MEMORY DEBUG ===")
 
     def verify_system_content(self, location: str) -> None:
-        """Helper method to verify system message content"""
-        logger.info(f"=== VERIFY SYSTEM CONTENT AT {location} ===")
-        logger.info(f"System message length: {len(self.system)}")
-        logger.info(f"Number of stored documents: {len(self.scraped_content)}")
+        """Debug helper that checks the system message still holds its documents section"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug(f"=== VERIFY SYSTEM CONTENT AT {location} ===")
+        logger.debug(f"System message length: {len(self.system)}")
+        logger.debug(f"Number of stored documents: {len(self.scraped_content)}")
         
         if self.messages and self.messages[0]["role"] == "system":
             # Check self.system
-            pattern = r'<documents>(.*?)</documents>'
-            sys_match = re.search(pattern, self.system, re.DOTALL)
-            if sys_match:
-                docs_content = sys_match.group(1)
-                logger.info(f"Documents section length in self.system: {len(docs_content)}")
+            sys_span = documents_span(self.system)
+            if sys_span:
+                docs_content = self.system[sys_span[0]:sys_span[1]]
+                logger.debug(f"Documents section length in self.system: {len(docs_content)}")
                 logger.debug(f"Documents content preview: {docs_content[:200]}...")
             else:
                 logger.error("No documents section found in self.system!")
                 logger.error(f"System message preview: {self.system[:200]}...")
             
-            # Check messages list
-            msg_match = re.search(pattern, self.messages[0]["content"], re.DOTALL)
-            if msg_match:
-                docs_content = msg_match.group(1)
-                logger.info(f"Documents section length in messages[0]: {len(docs_content)}")
-                logger.debug(f"Messages[0] documents preview: {docs_content[:200]}...")
-            else:
-                logger.error("No documents section found in messages[0]!")
+            # messages[0] normally holds the same string object, so only rescan when it differs
+            if self.system is not self.messages[0]["content"]:
+                msg_span = documents_span(self.messages[0]["content"])
+                if msg_span:
+                    logger.debug(f"Documents section length in messages[0]: {msg_span[1] - msg_span[0]}")
+                else:
+                    logger.error("No documents section found in messages[0]!")
             
             # Check if they match
             if self.system != self.messages[0]["content"]:
@@ -292,29 +788,41 @@ class ChatService:
                 logger.error("System length vs message length: " +
                            f"{len(self.system)} vs {len(self.messages[0]['content'])}")
         
-        logger.info(f"=== END VERIFY AT {location} ===")
+        logger.debug(f"=== END VERIFY AT {location} ===")
 
     def get_scraped_content(self) -> str:
         """Helper method to get current scraped content"""
-        pattern = r'<documents>(.*?)</documents>'
-        match = re.search(pattern, self.system, re.DOTALL)
-        if match:
-            return match.group(1).strip()
+        span = documents_span(self.system)
+        if span:
+            return self.system[span[0] + len("<documents>"):span[1] - len("</documents>")].strip()
         return ""
 
     def clear_context(self) -> None:
-        """Clear all scraped content from the chat context"""
+        """Clear all scraped content from the chat context (safe to call from the event loop)"""
         logger.info("Clearing chat context")
         
-        # Clear scraped content
-        self.scraped_content = {}
-        
-        # Update system message
-        self._update_system_message()
+        with self._lock:
+            document_urls = list(self.scraped_content) + list(self.archived_content)
+            # Evictions still summarizing haven't written a file yet; their results are discarded
+            self._pending_archives = {}
+            self._delete_archives(document_urls)
+            # Clear scraped content
+            self.scraped_content = {}
+            self.archived_content = {}
+            self._doc_tokens = {}
+            self._doc_token_counts = {}
+            self._doc_fragments = {}
+            self._doc_ids = {}
+            self._next_doc_id = 1
+            self._main_context_tokens = 0
+            
+            # Update system message
+            self._update_system_message()
         
-        logger.info("=== CLEAR CONTEXT VERIFICATION ===")
-        logger.info(f"Scraped content count: {len(self.scraped_content)}")
-        logger.info(f"System message preview: {self.system[:200]}...")
-        if self.messages:
-            logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
-        logger.info("=== END CLEAR CONTEXT VERIFICATION ===")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("=== CLEAR CONTEXT VERIFICATION ===")
+            logger.info(f"Scraped content count: {len(self.scraped_content)}")
+            logger.info(f"System message preview: {self.system[:200]}...")
+            if self.messages:
+                logger.info(f"First message preview: {self.messages[0]['content'][:200]}...")
+            logger.info("=== END CLEAR CONTEXT VERIFICATION ===")
@@ -1,32 +1,80 @@
-from typing import Optional
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import logging
 import httpx
-from app.core.config import settings
+import re
+from app.core.config import get_settings
+from app.core.database import ContentStore
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# One OpenRouter connection pool for the whole process: topic/cleaning calls here and the
+# streamed chat completions in app.services.chat. Closed on app shutdown.
+LLM_HTTP_CLIENT = httpx.AsyncClient(
+    base_url=settings.OPENROUTER_BASE_URL,
+    headers={
+        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+        "HTTP-Referer": "https://github.com/",  # Required for OpenRouter
+        "anthropic-beta": "prompt-caching-2024-07-31",
+    },
+    http2=True,
+    timeout=httpx.Timeout(60.0),
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+)
+
+CLEANED_CONTENT_PATTERN = re.compile(r'<cleaned_content index="(\d+)">\s*(.*?)\s*</cleaned_content>', re.DOTALL)
+
+# Pages shorter than this, or with fewer navigation-like lines than NAV_LINE_RATIO, skip the LLM clean
+CLEAN_PAGE_MAX_CHARS = 2000
+NAV_LINE_RATIO = 0.15
+# Links are stripped during conversion, so menus survive as runs of short bullets (or links, if kept)
+NAV_LINE_PATTERN = re.compile(r'^\s*(?:[-*+]\s+\S.{0,38}|[-*+]?\s*\[.*?\]\(.*?\))\s*$')
+CLEANED_CACHE_SIZE = 2048
+
+def looks_clean(markdown_content: str) -> bool:
+    """Heuristic for pages with too little navigation chrome to be worth an LLM clean"""
+    if len(markdown_content) < CLEAN_PAGE_MAX_CHARS:
+        return True
+    lines = [line for line in markdown_content.splitlines() if line.strip()]
+    if not lines:
+        return True
+    nav_lines = sum(1 for line in lines if NAV_LINE_PATTERN.match(line))
+    return nav_lines / len(lines) < NAV_LINE_RATIO
+
+def content_digest(content: str) -> str:
+    """Key cleaned pages by content, so an unchanged page is only ever cleaned once"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
 
 class LLMService:
-    def __init__(self):
+    def __init__(self, cache_store: Optional[ContentStore] = None, client: Optional[httpx.AsyncClient] = None):
         self.api_key = settings.OPENROUTER_API_KEY
         self.base_url = settings.OPENROUTER_BASE_URL
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": "https://github.com/",  # Required for OpenRouter
-            "Content-Type": "application/json"
-        }
+        self._client = client or LLM_HTTP_CLIENT
+        # Cleaned pages by content digest; futures so concurrent cleans of one page share a call.
+        # cache_store persists results across restarts.
+        self.cache_store = cache_store
+        self._cleaned: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        # Running clean tasks, referenced here so they aren't garbage collected mid-call
+        self._clean_tasks: Set[asyncio.Task] = set()
     
     async def _call_llm(self, prompt: str, max_tokens: Optional[int] = None) -> str:
         """Base method to call OpenRouter API"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    "model": settings.DEFAULT_MODEL,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": max_tokens or settings.MAX_TOKENS,
-                    "temperature": settings.TEMPERATURE
-                }
-            )
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+        response = await self._client.post(
+            "/chat/completions",
+            json={
+                "model": settings.DEFAULT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens or settings.MAX_TOKENS,
+                "temperature": settings.TEMPERATURE
+            }
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
 
     async def generate_topic(self, conversation_text: str) -> str:
         """Generate a concise topic/title for a conversation"""
@@ -39,16 +87,109 @@ Topic:"""
 
     async def clean_scraped_content(self, content: str) -> str:
         """Clean and structure scraped content using LLM"""
-        prompt = f"""Clean and structure the following scraped content. Remove any irrelevant information, 
-fix formatting issues, and ensure it's well-organized:
+        return await self.remove_webpage_noise(content)
+
+    async def remove_webpage_noise(self, markdown_content: str) -> str:
+        """Remove unnecessary webpage elements from one page; see remove_webpage_noise_batch"""
+        return (await self.remove_webpage_noise_batch([markdown_content]))[0]
+
+    async def remove_webpage_noise_batch(self, documents: List[str]) -> List[str]:
+        """Remove unnecessary webpage elements from several pages, returned in input order.
+        
+        Pages that already look clean are returned as is, and pages cleaned before are
+        served from the digest cache; the rest go to the LLM together in one call.
+        """
+        loop = asyncio.get_running_loop()
+        results = list(documents)
+        waiting: List[Tuple[int, asyncio.Future]] = []
+        uncached: Dict[str, Tuple[str, asyncio.Future]] = {}
+        for idx, document in enumerate(documents):
+            if looks_clean(document):
+                continue
+            digest = content_digest(document)
+            future = self._cleaned.get(digest)
+            if future is None:
+                future = loop.create_future()
+                self._remember_cleaned(digest, future)
+                uncached[digest] = (document, future)
+            else:
+                self._cleaned.move_to_end(digest)
+            waiting.append((idx, future))
+        
+        if uncached:
+            # Run in its own task so this caller disconnecting doesn't cancel it for the others
+            task = asyncio.create_task(self._clean_uncached(uncached))
+            self._clean_tasks.add(task)
+            task.add_done_callback(self._clean_done)
+        for idx, future in waiting:
+            # Shield so a cancelled caller only stops waiting; the clean still resolves the future
+            results[idx] = await asyncio.shield(future)
+        return results
 
-{content}
+    def _clean_done(self, task: asyncio.Task) -> None:
+        """Drop a finished clean task; its failure already reached the waiting futures"""
+        self._clean_tasks.discard(task)
+        if not task.cancelled():
+            # Mark retrieved so a failed clean doesn't log a warning
+            task.exception()
 
-Cleaned content:"""
-        return await self._call_llm(prompt)
+    def _remember_cleaned(self, digest: str, future: asyncio.Future) -> None:
+        """Cache a clean result, evicting the least recently used beyond CLEANED_CACHE_SIZE"""
+        self._cleaned[digest] = future
+        while len(self._cleaned) > CLEANED_CACHE_SIZE:
+            self._cleaned.popitem(last=False)
 
-    async def remove_webpage_noise(self, markdown_content: str) -> str:
-        """Remove unnecessary webpage elements while preserving important content.
+    async def _clean_uncached(self, uncached: Dict[str, Tuple[str, asyncio.Future]]) -> None:
+        """Resolve clean futures from the persistent cache, then one LLM call for the rest"""
+        loop = asyncio.get_running_loop()
+        try:
+            to_clean = []
+            for digest, (document, future) in uncached.items():
+                stored = None
+                if self.cache_store is not None:
+                    stored = await loop.run_in_executor(
+                        None, partial(self.cache_store.load, digest, "cleaned")
+                    )
+                if stored is not None:
+                    future.set_result(stored)
+                else:
+                    to_clean.append((digest, document, future))
+            if not to_clean:
+                return
+            
+            logger.info(f"Cleaning {len(to_clean)} of {len(uncached)} uncached pages with the LLM")
+            cleaned = await self._clean_documents([document for _, document, _ in to_clean])
+            for (_, _, future), content in zip(to_clean, cleaned):
+                future.set_result(content)
+        except BaseException as e:
+            for digest, (_, future) in uncached.items():
+                if future.done():
+                    continue
+                # Forget the failure so the next request retries the page
+                self._cleaned.pop(digest, None)
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Mark retrieved so an unawaited future doesn't log a warning
+                    future.exception()
+            raise
+        
+        # Persisting is best effort; the in-memory cache already holds the results
+        if self.cache_store is not None:
+            try:
+                await loop.run_in_executor(
+                    None,
+                    partial(
+                        self.cache_store.save_many,
+                        [(digest, {"cleaned": future.result()}) for digest, _, future in to_clean]
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error persisting {len(to_clean)} cleaned pages: {e}")
+
+    async def _clean_documents(self, documents: List[str]) -> List[str]:
+        """Remove unnecessary webpage elements from several pages in one LLM call.
         
         This method takes markdown-formatted webpage content and removes navigation elements,
         footers, sidebars, and other non-essential content while preserving:
@@ -57,12 +198,20 @@ Cleaned content:"""
         - Player information and performance data
         - Team news and updates
         - Important tables and lists
+        
+        Returns the cleaned pages in input order. A page the model returns no cleaned
+        block for is passed through unchanged.
         """
-        prompt = f"""You are an AI agent tasked with cleaning up a markdown-formatted version of a webpage. Your job is to remove unnecessary content while preserving the important information. Here is the markdown content you will be working with:
+        if not documents:
+            return []
+        
+        markdown_documents = "\n".join(
+            f'<markdown_content index="{idx}">\n{document}\n</markdown_content>'
+            for idx, document in enumerate(documents)
+        )
+        prompt = f"""You are an AI agent tasked with cleaning up markdown-formatted versions of webpages. Your job is to remove unnecessary content while preserving the important information. Here is the markdown content you will be working with, one block per webpage:
 
-<markdown_content>
-{markdown_content}
-</markdown_content>
+{markdown_documents}
 
 Your task is to carefully remove extraneous elements that are not part of the main content, such as navigation menus, footers, and other website-specific elements that may have been left over from the scraping and markdown conversion process. It is crucial that you preserve all the main content, including game stats, articles, and other high-information content.
 
@@ -84,18 +233,25 @@ When making decisions about what to remove:
 - Preserve any tables or lists that contain relevant information.
 - Do not alter or change any of the content you keep - only remove unnecessary elements.
 
-After processing the content, provide your output in the following format:
+After processing the content, provide your output for every webpage in the following format, using the same index as its markdown_content block:
 
-<cleaned_content>
+<cleaned_content index="0">
 [Insert the cleaned markdown content here, with unnecessary elements removed]
 </cleaned_content>
 
+Then provide a single summary:
+
 <removal_summary>
 [Provide a brief summary of what types of elements you removed, without going into specific details about the content]
 </removal_summary>
 
 Remember, your primary goal is to preserve the integrity of the main content while only removing clearly extraneous website elements. When in doubt, err on the side of keeping content rather than removing it."""
-        return await self._call_llm(prompt)
+        response = await self._call_llm(prompt)
+        
+        cleaned = {int(idx): content for idx, content in CLEANED_CONTENT_PATTERN.findall(response)}
+        return [cleaned.get(idx, document) for idx, document in enumerate(documents)]
 
 # Create global instance
-llm_service = LLMService() 
\ No newline at end of file
+llm_service = LLMService(
+    cache_store=ContentStore(settings.CONTENT_DB_PATH, compression_level=settings.CONTENT_COMPRESSION_LEVEL)
+) 
\ No newline at end of file
@@ -1,77 +1,652 @@
+import asyncio
+import hashlib
 import logging
-from typing import Optional
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from logging.handlers import QueueHandler
+from typing import DefaultDict, Dict, List, Optional, Set, Tuple
 from uuid import UUID, uuid4
-from app.models.scraper import ScrapeRequest, ScrapeResponse, URLEntry, URLStatus
-import json
+from app.models.scraper import ENTRY_BODY_EXCLUDE, ScrapeRequest, ScrapeResponse, URLEntry, URLEntryList, URLStatus
 import os
+import re
 from pathlib import Path
-import requests
+import httpx
 from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from markdownify import MarkdownConverter
+import trafilatura
+try:
+    # Rust-backed converter, ~10x faster than walking a bs4 tree with markdownify
+    from html_to_markdown import ConversionOptions, convert
+except ImportError:
+    convert = None
 from app.core.config import Settings
+from app.core.database import ContentStore, Row
 from app.services.llm import llm_service
+from app.services.tokenizer import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# Elements that never reach the markdown, cut from the raw bytes in one regex pass before the page is parsed
+STRIPPED_ELEMENTS = (b'script', b'style', b'noscript', b'svg')
+STRIPPED_ELEMENTS_PATTERN = re.compile(
+    rb'<(' + b'|'.join(STRIPPED_ELEMENTS) + rb')\b[^>]*>.*?</\1\s*>',
+    re.DOTALL | re.IGNORECASE
+)
+
+# nba.com navigation dropdowns; a compiled pattern lets bs4 match class values without a Python callback per tag
+DROPDOWN_CLASS_PATTERN = re.compile('dropdown', re.IGNORECASE)
+
+# Fetched pages with any other declared content type are rejected before reading the body
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml")
+
+# Plain fetches smaller than this, or with less visible text, are retried with rendering
+RENDER_FALLBACK_MIN_BYTES = 5_000
+RENDER_FALLBACK_MIN_TEXT = 200
+TAG_PATTERN = re.compile(rb'<[^>]*>')
+
+def needs_render(html: bytes) -> bool:
+    """Heuristic for pages whose content only appears once JavaScript runs"""
+    if len(html) < RENDER_FALLBACK_MIN_BYTES:
+        return True
+    text = TAG_PATTERN.sub(b' ', STRIPPED_ELEMENTS_PATTERN.sub(b'', html))
+    return len(b' '.join(text.split())) < RENDER_FALLBACK_MIN_TEXT
+
+# Entry fields sent to status event subscribers; content is fetched separately once complete
+STATUS_EVENT_FIELDS = {"id", "url", "status", "conversation_id", "token_count", "error"}
+# Events buffered per subscriber before a stalled client starts missing them
+STATUS_EVENT_QUEUE_SIZE = 100
+
+# Extractions shorter than this are treated as a miss and the whole page is converted instead
+MIN_EXTRACTED_CHARS = 200
+
+# Tags dropped from the markdown while keeping their text
+STRIPPED_MARKDOWN_TAGS = ['a', 'img']
+
+# Stateless once configured, so one converter serves every executor thread
+MARKDOWN_CONVERTER = MarkdownConverter(strip=STRIPPED_MARKDOWN_TAGS)
+
+CONVERSION_OPTIONS = (
+    ConversionOptions(strip_tags=set(STRIPPED_MARKDOWN_TAGS), extract_metadata=False)
+    if convert is not None else None
+)
+
+def _convert_markup(html: str) -> Optional[str]:
+    """Convert HTML with the Rust converter; None if it isn't installed or fails on the page"""
+    if convert is None:
+        return None
+    try:
+        return convert(html, CONVERSION_OPTIONS)
+    except Exception as e:
+        logger.warning(f"Rust markdown conversion failed, falling back to markdownify: {e}")
+        return None
+
+# Parser workers fork from a clean forkserver process rather than from the server, whose
+# executor threads, connection pools and log listener hold locks a child could inherit held
+PARSE_POOL_CONTEXT = multiprocessing.get_context("forkserver")
+
+def _init_parse_worker(log_queue: Optional[multiprocessing.Queue], log_level: str) -> None:
+    """Parser worker initializer: send log records to the server process's listener"""
+    if log_queue is None:
+        return
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [QueueHandler(log_queue)]
+    root_logger.setLevel(log_level)
+
+def html_to_markdown(
+    html: bytes,
+    url: str,
+    extract_main_content: bool = True,
+    encoding: Optional[str] = None
+) -> str:
+    """Convert the page's main content to markdown, falling back to the whole page.
+    
+    Takes the fetched bytes so no decoded copy of the page is made before parsing;
+    encoding is the declared charset, if any. Module-level so it can run in a parser
+    worker process.
+    """
+    # Remove script, style, noscript and inline svg elements
+    html = STRIPPED_ELEMENTS_PATTERN.sub(b'', html)
+    
+    if extract_main_content:
+        # Article/body extraction drops navs, sidebars and footers before any conversion
+        extracted = trafilatura.extract(
+            html,
+            url=url,
+            output_format='markdown',
+            include_tables=True,
+            include_links=False,
+            include_images=False,
+            favor_precision=True
+        )
+        if extracted and len(extracted) >= MIN_EXTRACTED_CHARS:
+            return extracted
+        logger.debug(f"Main content extraction missed for {url}, converting the whole page")
+    
+    is_nba = 'nba.com' in url.lower()
+    if convert is not None and not is_nba:
+        # No tree needed, so the markup goes straight to the converter
+        markdown_content = _convert_markup(html.decode(encoding or 'utf-8', errors='replace'))
+        if markdown_content is not None:
+            return markdown_content
+    
+    # Parse with the libxml2-backed parser
+    soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+        
+    # Special handling for NBA.com websites
+    if is_nba:
+        # Remove navigation dropdowns and menus
+        for dropdown in soup.find_all(class_=DROPDOWN_CLASS_PATTERN):
+            dropdown.decompose()
+
+    if convert is not None:
+        markdown_content = _convert_markup(str(soup))
+        if markdown_content is not None:
+            return markdown_content
+    # Convert the already-parsed tree; markdownify() would serialize and re-parse it
+    return MARKDOWN_CONVERTER.convert_soup(soup)
+
 class ScraperService:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, client: httpx.AsyncClient):
         self.settings = settings
-        # Create storage directory if it doesn't exist
-        self.settings.STORAGE_DIR.mkdir(parents=True, exist_ok=True)
-        self.storage_path = self.settings.STORAGE_DIR / "urls.json"
+        self.client = client
+        # URL entries are sharded by conversation, so a scrape only rewrites its own conversation's file
+        self.shards_dir = self.settings.STORAGE_DIR / "urls"
+        self.legacy_storage_path = self.settings.STORAGE_DIR / "urls.json"
+        self.content_store = ContentStore(
+            self.settings.CONTENT_DB_PATH,
+            compression_level=self.settings.CONTENT_COMPRESSION_LEVEL
+        )
         self._ensure_storage_exists()
+        
+        # In-memory indexes over the stored entries. Shards are read once at startup; this
+        # process is their only writer (settings refuse more than one worker)
+        self._entries: Dict[UUID, URLEntry] = {}
+        self._by_conv: DefaultDict[str, List[UUID]] = defaultdict(list)
+        self._by_url_conv: Dict[Tuple[str, str], UUID] = {}
+        for url_entry in self._load_urls():
+            self._index_entry(url_entry)
+        # Shard saves are debounced: conversations are marked dirty and written together
+        # URL_SAVE_DELAY later. The lock keeps two flushes from writing one shard at once.
+        self._dirty_conversations: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._store_lock = asyncio.Lock()
+        
+        # Status event queues of connected clients, by conversation
+        self._subscribers: DefaultDict[str, Set[asyncio.Queue]] = defaultdict(set)
+        
+        # Scrapes currently running, so duplicate requests await the same result
+        self._in_flight: Dict[Tuple[str, str, bool], asyncio.Task] = {}
+        # Recently fetched pages: (url, render) -> (fetched_at, (body, charset))
+        self._html_cache: "OrderedDict[Tuple[str, Optional[bool]], Tuple[float, Tuple[bytes, Optional[str]]]]" = OrderedDict()
+        # Conversions by HTML hash: html_sha1 -> (markdown, tokens). Filled from executor threads.
+        self._markdown_cache: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._markdown_cache_lock = threading.Lock()
+        # bs4 holds the GIL while converting, so conversions run in worker processes
+        # while fetches continue on the loop. Created by start_parse_pool in the startup hook.
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        # Where parser workers send their log records
+        self._parse_log_queue: Optional[multiprocessing.Queue] = None
 
     def _ensure_storage_exists(self):
-        """Ensure the storage directory and file exist"""
-        if not self.storage_path.exists():
-            # Create parent directories if they don't exist
-            self.storage_path.parent.mkdir(parents=True, exist_ok=True)
-            # Create the file with an empty list
-            with open(self.storage_path, 'w') as f:
-                json.dump([], f)
+        """Ensure the shard directory exists, splitting a legacy single-file urls.json into shards"""
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        if not self.legacy_storage_path.exists():
+            return
+        try:
+            with open(self.legacy_storage_path, 'rb') as f:
+                entries = URLEntryList.validate_json(f.read())
+            self._move_bodies_to_store(entries)
+            by_conv: DefaultDict[str, List[URLEntry]] = defaultdict(list)
+            for url_entry in entries:
+                by_conv[url_entry.conversation_id].append(url_entry)
+            for conversation_id, conversation_entries in by_conv.items():
+                self._save_urls(conversation_id, conversation_entries)
+            # Kept as a backup rather than deleted
+            self.legacy_storage_path.rename(self.legacy_storage_path.with_suffix('.json.migrated'))
+            logger.info(f"Migrated {len(entries)} URL entries into {len(by_conv)} conversation shards")
+        except Exception as e:
+            logger.error(f"Error migrating legacy URL storage: {e}", exc_info=True)
+
+    def _shard_path(self, conversation_id: str) -> Path:
+        """Storage file for one conversation's entries; ids come from clients, so the name is hashed"""
+        digest = hashlib.sha1(conversation_id.encode('utf-8')).hexdigest()[:16]
+        return self.shards_dir / f"{digest}.json"
 
     def _load_urls(self) -> list[URLEntry]:
-        """Load URLs from storage"""
+        """Load URLs from every conversation shard"""
+        urls = []
+        for shard_path in self.shards_dir.glob("*.json"):
+            shard_urls = self._read_shard(shard_path)
+            if self._move_bodies_to_store(shard_urls):
+                # Rewrite shards from before the content store without their page bodies
+                try:
+                    self._save_urls(shard_urls[0].conversation_id, shard_urls)
+                except Exception:
+                    pass  # Already logged; the next save of this conversation rewrites it
+            urls.extend(shard_urls)
+        return urls
+
+    def _read_shard(self, shard_path: Path) -> list[URLEntry]:
+        """Load one shard's URLs"""
         try:
-            if not self.storage_path.exists():
-                self._ensure_storage_exists()
-                return []
-            
-            with open(self.storage_path, 'r') as f:
-                data = json.load(f)
-                return [URLEntry.model_validate(entry) for entry in data]
+            with open(shard_path, 'rb') as f:
+                # Parsed and validated in one pydantic-core call, with no intermediate dicts
+                urls = URLEntryList.validate_json(f.read())
         except Exception as e:
-            logger.error(f"Error loading URLs: {e}")
+            logger.error(f"Error loading URLs from {shard_path.name}: {e}")
             return []
+        return urls
+
+    def _move_bodies_to_store(self, urls: list[URLEntry]) -> bool:
+        """Store page bodies older shards carried inline and drop them from the entries (blocking).
+        
+        Returns whether any entry had a body. Documents already in the store are kept.
+        """
+        bodies = []
+        for url_entry in urls:
+            documents = {}
+            if url_entry.raw_content:
+                documents["html"] = url_entry.raw_content
+            if url_entry.content:
+                documents["markdown"] = url_entry.content
+            if documents:
+                bodies.append((url_entry.id, documents))
+            url_entry.raw_content = None
+            url_entry.content = None
+        if not bodies:
+            return False
+        try:
+            self.content_store.save_many(bodies, replace=False)
+        except Exception as e:
+            logger.error(f"Error moving {len(bodies)} inline page bodies to the content store: {e}")
+        return True
 
-    def _save_urls(self, urls: list[URLEntry]):
-        """Save URLs to storage"""
+    def _save_urls(self, conversation_id: str, urls: list[URLEntry]):
+        """Save one conversation's URLs to its shard, atomically replacing the old file"""
         try:
             # Ensure parent directory exists
-            self.storage_path.parent.mkdir(parents=True, exist_ok=True)
+            self.shards_dir.mkdir(parents=True, exist_ok=True)
             
-            # Convert URLs to dict and save
-            with open(self.storage_path, 'w') as f:
-                json.dump([url.model_dump() for url in urls], f, default=str)
+            # Written beside the shard and renamed over it, so a crash mid-write leaves the
+            # previous version intact and readers never see a partial file
+            shard_path = self._shard_path(conversation_id)
+            tmp_path = shard_path.with_name(f"{shard_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                # Serialized straight from the models, with no intermediate dicts. Metadata
+                # only, so a scrape rewrites its conversation's entries but no page bodies.
+                f.write(URLEntryList.dump_json(urls, exclude=ENTRY_BODY_EXCLUDE))
+            os.replace(tmp_path, shard_path)
         except Exception as e:
             logger.error(f"Error saving URLs: {e}", exc_info=True)
             raise
 
-    def _get_url_entry(self, url_id: UUID) -> Optional[URLEntry]:
-        """Get a specific URL entry"""
-        urls = self._load_urls()
-        return next((url for url in urls if str(url.id) == str(url_id)), None)
+    def _index_entry(self, url_entry: URLEntry) -> None:
+        """Add an entry to the in-memory indexes, replacing any entry with the same id"""
+        if url_entry.id not in self._entries:
+            self._by_conv[url_entry.conversation_id].append(url_entry.id)
+        self._by_url_conv[(url_entry.url, url_entry.conversation_id)] = url_entry.id
+        self._entries[url_entry.id] = url_entry
+
+    def get_url_entry(self, url_id: UUID) -> Optional[URLEntry]:
+        """Get a specific URL entry's metadata, without its page bodies"""
+        return self._entries.get(UUID(str(url_id)))
+
+    def _find_url_entry(self, url: str, conversation_id: str) -> Optional[URLEntry]:
+        """Get a conversation's entry for a URL"""
+        url_id = self._by_url_conv.get((url, conversation_id))
+        return self._entries.get(url_id) if url_id is not None else None
+
+    def _get_cached_html(self, key: Tuple[str, Optional[bool]]) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Return a page fetched within SCRAPE_CACHE_TTL seconds, if any"""
+        cached = self._html_cache.get(key)
+        if cached is None:
+            return None
+        fetched_at, html = cached
+        if time.monotonic() - fetched_at > self.settings.SCRAPE_CACHE_TTL:
+            del self._html_cache[key]
+            return None
+        self._html_cache.move_to_end(key)
+        return html
+
+    def _cache_html(self, key: Tuple[str, Optional[bool]], html: Tuple[bytes, Optional[str]]) -> None:
+        """Remember a fetched page, evicting the least recently used beyond SCRAPE_CACHE_SIZE"""
+        self._html_cache[key] = (time.monotonic(), html)
+        self._html_cache.move_to_end(key)
+        while len(self._html_cache) > self.settings.SCRAPE_CACHE_SIZE:
+            self._html_cache.popitem(last=False)
+
+    async def _fetch_html(
+        self,
+        url: str,
+        use_cache: bool = True,
+        render: Optional[bool] = None
+    ) -> Tuple[bytes, Optional[str]]:
+        """Fetch a page through ScraperAPI, reusing a recent fetch when allowed.
+        
+        With render=None the page is fetched without a headless browser first, and
+        re-fetched rendered only if it looks like it needs JavaScript. Returns the
+        undecoded body and the charset the response declared, if any.
+        """
+        key = (url, render)
+        if use_cache:
+            html = self._get_cached_html(key)
+            if html is not None:
+                logger.info(f"Using cached fetch for URL: {url}")
+                return html
+        
+        if render is not None:
+            html = await self._request_page(url, render)
+        else:
+            try:
+                html = await self._request_page(url, False)
+                fallback = await asyncio.get_running_loop().run_in_executor(None, needs_render, html[0])
+            except httpx.HTTPError as e:
+                logger.info(f"Plain fetch of {url} failed ({e}), retrying with rendering")
+                fallback = True
+            else:
+                if fallback:
+                    logger.info(f"Plain fetch of {url} looks unrendered, retrying with rendering")
+            if fallback:
+                html = await self._request_page(url, True)
+        
+        self._cache_html(key, html)
+        return html
+
+    async def _request_page(self, url: str, render: bool) -> Tuple[bytes, Optional[str]]:
+        """One ScraperAPI request; rendering spins up a headless browser, so it gets the longer timeout"""
+        # Use ScraperAPI for reliable scraping
+        async with self.client.stream(
+            "GET",
+            "https://api.scraperapi.com",
+            params={
+                "api_key": self.settings.SCRAPER_API_KEY,
+                "url": url,
+                "render": "true" if render else "false"
+            },
+            timeout=self.settings.SCRAPER_TIMEOUT if render else self.settings.STATIC_FETCH_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                raise ValueError(f"Unsupported content type for {url}: {content_type}")
+            
+            # Stop reading at the cap so oversized pages never reach the parser whole
+            max_bytes = self.settings.MAX_RAW_HTML_BYTES
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= max_bytes:
+                    logger.warning(f"Truncating {url} at {max_bytes} bytes")
+                    del body[max_bytes:]
+                    break
+            return bytes(body), response.charset_encoding
+
+    def start_parse_pool(self, log_queue: Optional[multiprocessing.Queue] = None) -> None:
+        """Create the conversion worker pool; workers log to log_queue (a PARSE_POOL_CONTEXT queue)"""
+        self._parse_log_queue = log_queue
+        self._get_parse_pool()
+
+    def _get_parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        """The conversion worker pool, or None to convert on the default executor's threads"""
+        if self._parse_pool is None and self.settings.PARSER_PROCESSES != 0:
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=self.settings.PARSER_PROCESSES,
+                mp_context=PARSE_POOL_CONTEXT,
+                initializer=_init_parse_worker,
+                initargs=(self._parse_log_queue, self.settings.LOG_LEVEL)
+            )
+        return self._parse_pool
+
+    def _drop_parse_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Discard a broken pool so the next conversion starts a fresh one"""
+        if self._parse_pool is pool:
+            self._parse_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _convert(self, html: bytes, url: str, encoding: Optional[str]) -> str:
+        """Convert a page in the parser pool, restarting the pool once if a worker died"""
+        loop = asyncio.get_running_loop()
+        convert_page = partial(html_to_markdown, html, url, self.settings.EXTRACT_MAIN_CONTENT, encoding)
+        pool = self._get_parse_pool()
+        try:
+            return await loop.run_in_executor(pool, convert_page)
+        except BrokenProcessPool:
+            # A worker was killed (OOM, or a crash in lxml or the converter); a broken
+            # pool rejects all later work, so replace it rather than keep it cached
+            logger.error(f"Parser worker died converting {url}, restarting the pool")
+            self._drop_parse_pool(pool)
+        pool = self._get_parse_pool()
+        try:
+            return await loop.run_in_executor(pool, convert_page)
+        except BrokenProcessPool:
+            # Likely this page kills the worker; fail the scrape without leaving the pool broken
+            self._drop_parse_pool(pool)
+            raise
+
+    def shutdown(self) -> None:
+        """Write pending shard saves and stop the conversion worker processes"""
+        self.flush()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True, cancel_futures=True)
+            self._parse_pool = None
+
+    def read_content(self, url_id: UUID, max_bytes: Optional[int] = None) -> Optional[str]:
+        """Read stored markdown back, decompressing at most max_bytes; None if nothing was stored"""
+        return self.content_store.load(url_id, "markdown", max_bytes)
+
+    def _with_bodies(self, url_entry: URLEntry) -> URLEntry:
+        """Copy of an entry with its page bodies loaded from the content store (blocking)"""
+        return url_entry.model_copy(update={
+            "raw_content": self.content_store.load(url_entry.id, "html"),
+            "content": self.read_content(url_entry.id),
+        })
+
+    async def _parse_and_store(
+        self,
+        url_entry: URLEntry,
+        html: bytes,
+        encoding: Optional[str] = None
+    ) -> tuple[str, int]:
+        """Convert HTML to markdown and persist both versions, off the event loop.
+        
+        Returns the markdown and its token count.
+        """
+        loop = asyncio.get_running_loop()
+        html_hash = hashlib.sha1(html).hexdigest()
+        # Raw HTML is kept for debugging/comparison. It doesn't depend on the conversion,
+        # so it is decoded and compressed on a thread while the page converts.
+        html_rows, (markdown_content, cached) = await asyncio.gather(
+            loop.run_in_executor(None, partial(self._compress_html, url_entry.id, html, encoding)),
+            self._convert_cached(url_entry, html, html_hash, encoding)
+        )
+        return await loop.run_in_executor(
+            None,
+            partial(self._store_documents, url_entry, html_rows, html_hash, markdown_content, cached)
+        )
+
+    def _compress_html(self, entry_id: UUID, html: bytes, encoding: Optional[str]) -> List[Row]:
+        """Decode and compress a page's raw HTML for the content store (blocking)"""
+        return self.content_store.compress([(entry_id, {"html": html.decode(encoding or "utf-8", errors="replace")})])
+
+    async def _convert_cached(
+        self,
+        url_entry: URLEntry,
+        html: bytes,
+        html_hash: str,
+        encoding: Optional[str] = None
+    ) -> Tuple[str, Optional[Tuple[str, int]]]:
+        """Convert HTML to markdown, reusing conversions of identical HTML; also returns the cache hit"""
+        cached = self._get_cached_markdown(html_hash)
+        if cached is not None:
+            logger.info(f"Reusing markdown conversion for unchanged HTML of {url_entry.url}")
+            return cached[0], cached
+        return await self._convert(html, url_entry.url, encoding), None
+
+    def _store_documents(
+        self,
+        url_entry: URLEntry,
+        html_rows: List[Row],
+        html_hash: str,
+        markdown_content: str,
+        cached: Optional[Tuple[str, int]]
+    ) -> tuple[str, int]:
+        """Count a conversion and persist it with the raw HTML (blocking).
+        
+        Both rows go in one transaction, so a failed conversion never leaves an html row behind.
+        """
+        if cached is not None:
+            token_count = cached[1]
+        else:
+            token_count = count_tokens(markdown_content)
+        markdown_rows = self.content_store.compress([(url_entry.id, {"markdown": markdown_content})])
+        self.content_store.write_rows(html_rows + markdown_rows)
+        if cached is None:
+            self._cache_markdown(html_hash, markdown_content, token_count)
+        return markdown_content, token_count
+
+    def _get_cached_markdown(self, html_hash: str) -> Optional[Tuple[str, int]]:
+        """Markdown and token count recently produced from identical HTML, if any"""
+        with self._markdown_cache_lock:
+            cached = self._markdown_cache.get(html_hash)
+            if cached is not None:
+                self._markdown_cache.move_to_end(html_hash)
+            return cached
+
+    def _cache_markdown(self, html_hash: str, markdown_content: str, token_count: int) -> None:
+        """Remember a conversion, evicting the least recently used beyond MARKDOWN_CACHE_SIZE"""
+        with self._markdown_cache_lock:
+            self._markdown_cache[html_hash] = (markdown_content, token_count)
+            self._markdown_cache.move_to_end(html_hash)
+            while len(self._markdown_cache) > self.settings.MARKDOWN_CACHE_SIZE:
+                self._markdown_cache.popitem(last=False)
 
     async def scrape_url(self, request: ScrapeRequest) -> ScrapeResponse:
-        """Scrape a URL and store its content"""
-        urls = self._load_urls()
+        """Scrape a URL and store its content, sharing the result with identical concurrent requests"""
+        key = (request.url, request.conversation_id, request.force_refresh)
+        in_flight = self._in_flight.get(key)
+        if in_flight is None and not request.force_refresh:
+            # A forced re-scrape already running yields a fresher entry than this request would
+            in_flight = self._in_flight.get((request.url, request.conversation_id, True))
+        elif in_flight is None and self._find_url_entry(request.url, request.conversation_id) is None:
+            # Nothing stored to refresh yet: share the running plain scrape of this new URL,
+            # since a second scrape would index a duplicate entry for it
+            in_flight = self._in_flight.get((request.url, request.conversation_id, False))
+        if in_flight is None:
+            # Run in its own task so the first caller disconnecting doesn't cancel it for the others
+            in_flight = asyncio.create_task(self._scrape(request))
+            self._in_flight[key] = in_flight
+            in_flight.add_done_callback(partial(self._scrape_done, key))
+        else:
+            logger.info(f"Joining in-flight scrape for URL: {request.url}")
+        # Shield so a cancelled caller only stops waiting; the scrape still finishes and is stored
+        return await asyncio.shield(in_flight)
+
+    def _scrape_done(self, key: Tuple[str, str, bool], task: asyncio.Task) -> None:
+        """Drop a finished scrape from the in-flight table"""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark retrieved so a scrape every caller gave up on doesn't log a warning
+            task.exception()
+
+    async def scrape_urls(self, requests: List[ScrapeRequest]) -> List[ScrapeResponse]:
+        """Scrape several URLs concurrently, at most SCRAPER_CONCURRENCY at a time.
         
+        Responses come back in request order.
+        """
+        semaphore = asyncio.Semaphore(self.settings.SCRAPER_CONCURRENCY)
+        
+        async def scrape_one(request: ScrapeRequest) -> ScrapeResponse:
+            async with semaphore:
+                return await self.scrape_url(request)
+        
+        return await asyncio.gather(*(scrape_one(request) for request in requests))
+
+    def _mark_dirty(self, conversation_id: str) -> None:
+        """Queue a conversation's shard for the next debounced save"""
+        self._dirty_conversations.add(conversation_id)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.settings.URL_SAVE_DELAY, self._start_flush
+            )
+
+    def _start_flush(self) -> None:
+        """Timer callback: write the dirty shards in a task"""
+        self._flush_handle = None
+        task = asyncio.create_task(self._flush_dirty())
+        # Keep a reference so the task isn't garbage collected mid-write
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_dirty(self) -> None:
+        """Write every dirty shard on the executor, one at a time"""
+        loop = asyncio.get_running_loop()
+        failed = []
+        async with self._store_lock:
+            while self._dirty_conversations:
+                conversation_id = self._dirty_conversations.pop()
+                try:
+                    await loop.run_in_executor(
+                        None,
+                        partial(self._save_urls, conversation_id, self._conversation_entries(conversation_id))
+                    )
+                except Exception:
+                    # Already logged; retried with the next flush
+                    failed.append(conversation_id)
+        for conversation_id in failed:
+            self._mark_dirty(conversation_id)
+
+    def flush(self) -> None:
+        """Write every dirty shard now (blocking), e.g. on shutdown"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._dirty_conversations:
+            conversation_id = self._dirty_conversations.pop()
+            try:
+                self._save_urls(conversation_id, self._conversation_entries(conversation_id))
+            except Exception:
+                pass  # Already logged by _save_urls
+
+    def subscribe(self, conversation_id: str) -> asyncio.Queue:
+        """Register for a conversation's status events; pair with unsubscribe"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STATUS_EVENT_QUEUE_SIZE)
+        self._subscribers[conversation_id].add(queue)
+        return queue
+
+    def unsubscribe(self, conversation_id: str, queue: asyncio.Queue) -> None:
+        """Stop delivering a conversation's status events to a queue"""
+        subscribers = self._subscribers.get(conversation_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[conversation_id]
+
+    def _publish(self, url_entry: URLEntry, status: Optional[URLStatus] = None) -> None:
+        """Send an entry's status (or an override, e.g. LOADING during a refresh) to subscribers"""
+        subscribers = self._subscribers.get(url_entry.conversation_id)
+        if not subscribers:
+            return
+        event = url_entry.model_dump(mode="json", include=STATUS_EVENT_FIELDS)
+        if status is not None:
+            event["status"] = status.value
+        for queue in subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping status event for {url_entry.url}; subscriber is not reading")
+
+    async def _scrape(self, request: ScrapeRequest) -> ScrapeResponse:
+        """Scrape a URL and store its content"""
         # Check if URL already exists for this conversation
-        existing_url = next(
-            (url for url in urls 
-             if url.url == request.url and url.conversation_id == request.conversation_id),
-            None
-        )
+        existing_url = self._find_url_entry(request.url, request.conversation_id)
 
         if existing_url and not request.force_refresh:
             return ScrapeResponse(url_entry=existing_url)
@@ -83,68 +658,45 @@ class ScraperService:
             status=URLStatus.LOADING,
             conversation_id=request.conversation_id
         )
+        self._publish(url_entry, URLStatus.LOADING)
 
         try:
-            # Use ScraperAPI for reliable scraping
-            api_url = f"http://api.scraperapi.com?api_key={self.settings.SCRAPER_API_KEY}&url={request.url}&render=true"
-            response = requests.get(api_url, timeout=60)  # Add timeout
-            response.raise_for_status()
-
-            # Save raw HTML
-            html_path = self.settings.SCRAPED_CONTENT_DIR / f"{url_entry.id}.html"
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(response.text)
-            url_entry.raw_content = response.text
-
-            # Parse HTML and convert to markdown
-            soup = BeautifulSoup(response.text, 'html.parser')
+            html, encoding = await self._fetch_html(
+                request.url,
+                use_cache=not request.force_refresh,
+                render=request.render
+            )
+            # Conversion runs in the parser pool, so other fetches keep going meanwhile.
+            # Both versions go to the content store; the entry only keeps the token count.
+            _, token_count = await self._parse_and_store(url_entry, html, encoding)
             
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-                
-            # Special handling for NBA.com websites
-            if 'nba.com' in request.url.lower():
-                # Remove navigation dropdowns and menus
-                for dropdown in soup.find_all(class_=lambda x: x and ('dropdown' in x.lower())):
-                    dropdown.decompose()
-
-            # Convert to markdown using markdownify
-            markdown_content = md(str(soup), strip=['a', 'img'])
-            
-            # Use LLM to clean up the content
-            url_entry.content = markdown_content
+            url_entry.token_count = token_count
             url_entry.status = URLStatus.COMPLETE
             url_entry.error = None
 
-            # Save both versions to separate files for debugging/comparison
-            raw_path = self.settings.SCRAPED_CONTENT_DIR / f"{url_entry.id}_raw.md"
-            clean_path = self.settings.SCRAPED_CONTENT_DIR / f"{url_entry.id}_clean.md"
-            
-            with open(raw_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
-
         except Exception as e:
             logger.error(f"Error scraping URL {request.url}: {e}", exc_info=True)
             url_entry.status = URLStatus.ERROR
             url_entry.error = str(e)
-            url_entry.content = None
-            url_entry.raw_content = None
+            url_entry.token_count = None
 
-        # Update storage
-        if existing_url:
-            urls = [url_entry if url.id == url_entry.id else url for url in urls]
-        else:
-            urls.append(url_entry)
-        
-        self._save_urls(urls)
+        # Update storage; the shard itself is written by the next debounced flush
+        self._index_entry(url_entry)
+        self._mark_dirty(url_entry.conversation_id)
+        self._publish(url_entry)
         return ScrapeResponse(url_entry=url_entry)
 
-    def get_url_content(self, url_id: UUID) -> Optional[URLEntry]:
-        """Get content for a specific URL"""
-        return self._get_url_entry(url_id)
+    async def get_url_content(self, url_id: UUID) -> Optional[URLEntry]:
+        """Get a URL entry with its page bodies, read from the content store once scraped"""
+        url_entry = self.get_url_entry(url_id)
+        if url_entry is None or url_entry.status != URLStatus.COMPLETE:
+            return url_entry
+        return await asyncio.get_running_loop().run_in_executor(None, self._with_bodies, url_entry)
 
     def get_conversation_urls(self, conversation_id: str) -> list[URLEntry]:
         """Get all URLs for a specific conversation"""
-        urls = self._load_urls()
-        return [url for url in urls if url.conversation_id == conversation_id]
+        return self._conversation_entries(conversation_id)
+
+    def _conversation_entries(self, conversation_id: str) -> list[URLEntry]:
+        """A conversation's entries from the in-memory index"""
+        return [self._entries[url_id] for url_id in self._by_conv.get(conversation_id, ())]
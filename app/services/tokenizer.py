@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Collection, List, Union
+import logging
+import tiktoken
+from app.core.config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ENCODING = "cl100k_base"
+
+class FastTokenizerAdapter:
+    """Expose a HuggingFace fast (Rust) tokenizer through tiktoken's encode signature"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def encode(self, text: str, disallowed_special: Union[str, Collection[str]] = ()) -> List[int]:
+        # HF tokenizers never raise on special-token text, so disallowed_special is accepted and ignored
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+def _load_fast_tokenizer(tokenizer_model: str) -> FastTokenizerAdapter:
+    """Load the Rust-backed HF tokenizer; transformers is only needed when TOKENIZER_MODEL is set"""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_model, use_fast=True)
+    if not tokenizer.is_fast:
+        logger.warning(f"No fast tokenizer available for {tokenizer_model}, counts will use the Python tokenizer")
+    return FastTokenizerAdapter(tokenizer)
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str) -> Union[tiktoken.Encoding, FastTokenizerAdapter]:
+    """Return a native tokenizer for a model.
+
+    OpenAI-family models use their tiktoken encoding. Other models use the HF fast
+    tokenizer named by TOKENIZER_MODEL when configured, else cl100k as an approximation.
+    """
+    # OpenRouter model ids are "<provider>/<model>"; tiktoken only knows the model part
+    model_name = model.split("/", 1)[-1]
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        pass
+
+    if settings.TOKENIZER_MODEL:
+        try:
+            return _load_fast_tokenizer(settings.TOKENIZER_MODEL)
+        except Exception as e:
+            logger.error(f"Could not load tokenizer {settings.TOKENIZER_MODEL}: {e}")
+
+    logger.debug(f"No tiktoken encoding for {model}, using {FALLBACK_ENCODING}")
+    return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+def count_tokens(text: str, model: str = settings.DEFAULT_MODEL) -> int:
+    """Count tokens in text; scraped pages may contain special-token strings, so none are disallowed"""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import ConversationDrawer from './components/ConversationDrawer';
 import URLManager from './components/URLManager';
 import MarkdownMessage from './components/MarkdownMessage';
@@ -14,7 +14,7 @@ interface URLEntry {
   url: string;
   status: 'pending' | 'loading' | 'complete' | 'error';
   conversation_id: string;
-  content?: string;
+  token_count?: number;
   error?: string;
 }
 
@@ -49,6 +49,41 @@ const App: React.FC = () => {
     localStorage.setItem('conversations', JSON.stringify(conversations));
   }, [conversations]);
 
+  // Scrape status changes are pushed by the server rather than polled
+  useEffect(() => {
+    if (!selectedConversationId) return;
+
+    const events = new EventSource(
+      `/api/v1/scraper/events/${encodeURIComponent(selectedConversationId)}`
+    );
+    events.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type !== 'status') return;
+      const update: URLEntry = data.entry;
+
+      // New entries arrive with the scrape response; only known entries are updated here
+      setConversations(prevConversations => {
+        let changed = false;
+        const next = prevConversations.map(conv =>
+          conv.id === update.conversation_id
+            ? {
+                ...conv,
+                urls: conv.urls.map(url => {
+                  if (url.id !== update.id || (url.status === update.status && url.error === update.error)) {
+                    return url;
+                  }
+                  changed = true;
+                  return { ...url, status: update.status, error: update.error };
+                }),
+              }
+            : conv
+        );
+        return changed ? next : prevConversations;
+      });
+    };
+    return () => events.close();
+  }, [selectedConversationId]);
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   };
@@ -99,20 +134,24 @@ const App: React.FC = () => {
     }
   };
 
-  const updateChatContext = async (conversationId: string, urls: URLEntry[]) => {
+  const updateChatContext = useCallback(async (conversationId: string, urls: URLEntry[]) => {
     try {
       // First, clear the existing context
       await fetch('/api/v1/chat/context/clear', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Conversation-ID': conversationId,
+        },
         body: JSON.stringify({ conversation_id: conversationId }),
       });
 
       // Then add all URLs to the context in sequence
       for (const url of urls) {
-        if (url.status === 'complete' && url.content) {
+        if (url.status === 'complete') {
           await fetch(`/api/v1/chat/context/${url.id}`, {
             method: 'POST',
+            headers: { 'X-Conversation-ID': conversationId },
           });
         }
       }
@@ -120,35 +159,44 @@ const App: React.FC = () => {
       console.error('Failed to update chat context:', error);
       setError('Failed to update chat context with URLs');
     }
-  };
+  }, []);
 
-  const handleAddUrl = async (url: string) => {
+  const handleAddUrl = useCallback(async (input: string) => {
     if (!selectedConversationId) return;
 
     try {
-      const response = await fetch('/api/v1/scraper/url', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ 
-          url,
-          conversation_id: selectedConversationId,
-          force_refresh: false 
-        }),
-      });
+      // Several whitespace-separated URLs are scraped together in one batch request
+      const requests = input.split(/\s+/).filter(Boolean).map(url => ({
+        url,
+        conversation_id: selectedConversationId,
+        force_refresh: false
+      }));
+      if (requests.length === 0) return;
+
+      const response = await fetch(
+        requests.length === 1 ? '/api/v1/scraper/url' : '/api/v1/scraper/urls',
+        {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(requests.length === 1 ? requests[0] : { requests }),
+        }
+      );
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
       const data = await response.json();
+      const responses: { url_entry: URLEntry }[] = requests.length === 1 ? [data] : data.responses;
+      const newEntries = responses.map(r => ({ ...r.url_entry, conversation_id: selectedConversationId }));
       
-      // Update conversations with the new URL
+      // Update conversations with the new URLs
       setConversations(prevConversations =>
         prevConversations.map(conv =>
           conv.id === selectedConversationId
             ? {
                 ...conv,
-                urls: [...conv.urls, { ...data.url_entry, conversation_id: selectedConversationId }],
+                urls: [...conv.urls, ...newEntries],
               }
             : conv
         )
@@ -160,16 +208,16 @@ const App: React.FC = () => {
         // Update chat context with all URLs
         await updateChatContext(selectedConversationId, [
           ...updatedConversation.urls,
-          { ...data.url_entry, conversation_id: selectedConversationId }
+          ...newEntries
         ]);
       }
     } catch (error) {
       setError(error instanceof Error ? error.message : 'Failed to add URL');
       throw error;
     }
-  };
+  }, [conversations, selectedConversationId, updateChatContext]);
 
-  const handleRefreshUrl = async (entry: URLEntry) => {
+  const handleRefreshUrl = useCallback(async (entry: URLEntry) => {
     try {
       const response = await fetch('/api/v1/scraper/url', {
         method: 'POST',
@@ -211,9 +259,9 @@ const App: React.FC = () => {
       setError(error instanceof Error ? error.message : 'Failed to refresh URL');
       throw error;
     }
-  };
+  }, [conversations, updateChatContext]);
 
-  const handleEditUrl = async (entry: URLEntry, newUrl: string) => {
+  const handleEditUrl = useCallback(async (entry: URLEntry, newUrl: string) => {
     try {
       // Add the new URL
       const response = await fetch('/api/v1/scraper/url', {
@@ -256,9 +304,9 @@ const App: React.FC = () => {
       setError(error instanceof Error ? error.message : 'Failed to edit URL');
       throw error;
     }
-  };
+  }, [conversations, updateChatContext]);
 
-  const handleDeleteUrl = async (entry: URLEntry) => {
+  const handleDeleteUrl = useCallback(async (entry: URLEntry) => {
     try {
       // Update conversations state first
       setConversations(prevConversations =>
@@ -285,7 +333,7 @@ const App: React.FC = () => {
       setError(error instanceof Error ? error.message : 'Failed to delete URL');
       throw error;
     }
-  };
+  }, [conversations, updateChatContext]);
 
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -321,7 +369,10 @@ const App: React.FC = () => {
     try {
       const response = await fetch('/api/v1/chat/message', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Conversation-ID': selectedConversationId,
+        },
         body: JSON.stringify({ 
           message: userInput,
           conversation_id: selectedConversationId
@@ -332,11 +383,34 @@ const App: React.FC = () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
+      // The reply arrives as server-sent events; render it as it streams in
+      const reader = response.body!.getReader();
+      const decoder = new TextDecoder();
+      const streamTimestamp = new Date().toISOString();
+      let buffer = '';
+      let content = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const event of events) {
+          if (!event.startsWith('data: ')) continue;
+          const payload = JSON.parse(event.slice('data: '.length));
+          if (payload.type === 'error') {
+            throw new Error(payload.detail);
+          }
+          if (payload.type === 'delta') {
+            content += payload.content;
+            setMessages([...updatedMessages, { role: 'assistant', content, timestamp: streamTimestamp }]);
+          }
+        }
+      }
       
       const assistantMessage: Message = {
         role: 'assistant',
-        content: data.message?.content || 'No response content',
+        content: content || 'No response content',
         timestamp: new Date().toISOString(),
       };
 
@@ -2,6 +2,9 @@ import React, { useState } from 'react';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 
+// Hoisted so every render passes the same plugin list
+const REMARK_PLUGINS = [remarkGfm];
+
 interface MarkdownMessageProps {
   content: string;
   isAssistant: boolean;
@@ -27,7 +30,7 @@ const MarkdownMessage: React.FC<MarkdownMessageProps> = ({ content, isAssistant
         <div className="prose prose-sm prose-invert max-w-none">
           {showMarkdown ? (
             <ReactMarkdown 
-              remarkPlugins={[remarkGfm]}
+              remarkPlugins={REMARK_PLUGINS}
               className={`${isAssistant ? 'text-gray-100' : 'text-gray-100'} 
                          [&_a]:text-indigo-400 [&_code]:text-teal-300 
                          [&_pre]:bg-gray-900/50 [&_blockquote]:border-l-gray-600
@@ -76,4 +79,6 @@ const MarkdownMessage: React.FC<MarkdownMessageProps> = ({ content, isAssistant
   );
 };
 
-export default MarkdownMessage; 
\ No newline at end of file
+// Memoized: typing or streaming re-renders App, but a message only re-parses its
+// markdown when its own content changes
+export default React.memo(MarkdownMessage); 
\ No newline at end of file
@@ -6,9 +6,14 @@ interface URLEntry {
   url: string;
   status: 'pending' | 'loading' | 'complete' | 'error';
   conversation_id: string;
+  token_count?: number;
+  error?: string;
+}
+
+// Page bodies aren't part of the URL list; the preview loads them from the content endpoint
+interface URLContent {
   content?: string;
   raw_content?: string;
-  error?: string;
 }
 
 interface URLManagerProps {
@@ -35,6 +40,7 @@ const URLManager: React.FC<URLManagerProps> = ({
   const [editValue, setEditValue] = useState('');
   const [previewingId, setPreviewingId] = useState<string | null>(null);
   const [showRawContent, setShowRawContent] = useState<Record<string, boolean>>({});
+  const [previewContent, setPreviewContent] = useState<URLContent | null>(null);
 
   // Reset states when URL manager is collapsed
   useEffect(() => {
@@ -51,6 +57,29 @@ const URLManager: React.FC<URLManagerProps> = ({
     }
   }, [previewingId]);
 
+  // Load the previewed entry's content; reloaded when its status changes, e.g. after a refresh
+  const previewStatus = urls.find(entry => entry.id === previewingId)?.status;
+  useEffect(() => {
+    setPreviewContent(null);
+    if (!previewingId || previewStatus !== 'complete') return;
+
+    let cancelled = false;
+    fetch(`/api/v1/scraper/content/${previewingId}`)
+      .then(response => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+      })
+      .then((data: URLContent) => {
+        if (!cancelled) setPreviewContent(data);
+      })
+      .catch(error => console.error('Failed to load URL content:', error));
+    return () => {
+      cancelled = true;
+    };
+  }, [previewingId, previewStatus]);
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!newUrl.trim() || isLoading) return;
@@ -258,7 +287,7 @@ const URLManager: React.FC<URLManagerProps> = ({
                     </div>
                   </div>
 
-                  {previewingId === entry.id && (entry.content || entry.raw_content) && (
+                  {previewingId === entry.id && previewContent && (previewContent.content || previewContent.raw_content) && (
                     <div className="mt-4 flex-1 min-h-0 flex flex-col">
                       <div className="flex justify-between items-center flex-shrink-0">
                         <button
@@ -270,7 +299,7 @@ const URLManager: React.FC<URLManagerProps> = ({
                       </div>
                       <div className="mt-2 flex-1 bg-gray-800 rounded-lg p-4 overflow-y-auto overflow-x-hidden whitespace-pre-wrap">
                         <MarkdownMessage
-                          content={showRawContent[entry.id] ? entry.raw_content! : entry.content!}
+                          content={showRawContent[entry.id] ? previewContent.raw_content! : previewContent.content!}
                           isAssistant={true}
                         />
                       </div>
@@ -286,4 +315,6 @@ const URLManager: React.FC<URLManagerProps> = ({
   );
 };
 
-export default URLManager; 
\ No newline at end of file
+// Memoized with App's handlers wrapped in useCallback, so typing in the chat input or
+// streaming a reply doesn't re-render the URL list and its content preview
+export default React.memo(URLManager); 
\ No newline at end of file